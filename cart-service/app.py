@@ -230,7 +230,7 @@ class CartManager:
                 return {"status": "error", "message": "Failed to retrieve cart items"}
             
             items = response.json().get('data', [])
-            updated_count = 0
+            operations = []
             
             # Update promotions for each item
             for item in items:
@@ -278,25 +278,32 @@ class CartManager:
                         "discounted_price": None
                     })
                 
-                # Update the item
-                update_response = requests.put(
-                    f"{self.db_service_url}/tables/cart_items/data",
-                    json={"values": update_data, "condition": "item_id = ?", "params": [item_id]}
+                # Queue the item update
+                operations.append({
+                    "op": "update",
+                    "table": "cart_items",
+                    "values": update_data,
+                    "condition": "item_id = ?",
+                    "params": [item_id]
+                })
+            
+            # Write all item updates and the cart timestamp in one batch
+            if operations:
+                operations.append({
+                    "op": "update",
+                    "table": "carts",
+                    "values": {"updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")},
+                    "condition": "cart_id = ?",
+                    "params": [cart_id]
+                })
+                
+                batch_response = requests.post(
+                    f"{self.db_service_url}/batch",
+                    json={"operations": operations}
                 )
                 
-                if update_response.status_code == 200:
-                    updated_count += 1
-            
-            # Update cart timestamp
-            if updated_count > 0:
-                update_data = {
-                    "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-                
-                requests.put(
-                    f"{self.db_service_url}/tables/carts/data",
-                    json={"values": update_data, "condition": "cart_id = ?", "params": [cart_id]}
-                )
+                if batch_response.status_code != 200 or batch_response.json().get('status') != 'success':
+                    logger.error(f"Failed to update cart promotions: {batch_response.text}")
             
             # Return the updated cart
             return self.get_cart_with_items(customer_id)
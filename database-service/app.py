@@ -2,13 +2,30 @@
 # Database Management System Microservice
 # RESTful API using Flask
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import sqlite3
 import os
-from datetime import datetime
+import json
+import math
+import base64
+import codecs
+import csv
+import io
+import re
+from datetime import datetime, timedelta
 import logging
 from flask_cors import CORS
 import uuid
+import fcntl
+import gzip
+import itertools
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from urllib.request import pathname2url
 
 # Configure logging
 logging.basicConfig(
@@ -20,24 +37,1284 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Connection pool defaults, overridable per database through /api/connect.
+# DB_POOL_SIZE sizes the read-only pool; writes go through a separate pool
+# that defaults to a single connection since SQLite allows one writer.
+DEFAULT_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DEFAULT_WRITE_POOL_SIZE = int(os.environ.get('DB_WRITE_POOL_SIZE', 1))
+DEFAULT_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+
+# SQLite tuning applied to every pooled connection, overridable per database
+DEFAULT_PRAGMAS = {
+    # Must come before journal_mode, which creates the file. Existing files
+    # only switch after a full VACUUM (POST /api/maintenance/run).
+    "auto_vacuum": os.environ.get('DB_AUTO_VACUUM', 'INCREMENTAL'),
+    "journal_mode": os.environ.get('DB_JOURNAL_MODE', 'WAL'),
+    "busy_timeout": int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+    "synchronous": os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+    "cache_size": int(os.environ.get('DB_CACHE_SIZE', -16000)),
+    "mmap_size": int(os.environ.get('DB_MMAP_SIZE', 268435456)),
+    # Rows removed by INSERT OR REPLACE fire delete triggers, which keeps
+    # the change log and row counters exact
+    "recursive_triggers": os.environ.get('DB_RECURSIVE_TRIGGERS', 'ON'),
+}
+PRAGMA_VALUE_RE = re.compile(r'^(-?\d+|[A-Za-z]+)$')
+
+# Optional group commit: single-statement writes are queued to one writer
+# thread per database and committed together, up to a batch size or after
+# waiting at most the latency budget for more writes to arrive
+GROUP_COMMIT = os.environ.get('DB_GROUP_COMMIT', 'false').lower() == 'true'
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('DB_GROUP_COMMIT_MAX_BATCH', 64))
+GROUP_COMMIT_MAX_WAIT_MS = float(os.environ.get('DB_GROUP_COMMIT_MAX_WAIT_MS', 2))
+# Longest a caller waits for its queued write before giving up on the writer
+GROUP_COMMIT_SUBMIT_TIMEOUT_S = float(os.environ.get('DB_GROUP_COMMIT_SUBMIT_TIMEOUT_S', 60))
+
+# Statement time budgets in milliseconds; 0 means unlimited. The default
+# applies to every caller not listed in DB_CALLER_TIMEOUTS_MS, a JSON object
+# such as {"order-service": 2000}. A request can tighten its own budget with
+# the X-Statement-Timeout-Ms header but never extend it.
+STATEMENT_TIMEOUT_MS = float(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+CALLER_TIMEOUTS_MS = json.loads(os.environ.get('DB_CALLER_TIMEOUTS_MS') or '{}')
+# SQLite VM instructions between checks of a statement's deadline
+PROGRESS_HANDLER_STEPS = 1000
+
+# Prepared statements kept per pooled connection (sqlite3's statement cache),
+# sized so registered named queries stay prepared alongside ad-hoc SQL
+STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256))
+
+# Names accepted for registered queries, e.g. "active_promotions" or "orders.stats"
+QUERY_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_.-]*$')
+# Bind parameters in a statement: "?", "?3", ":name", "@name" or "$name"
+BIND_PARAMETER_RE = re.compile(r'\?(\d*)|[:@$]([A-Za-z_][A-Za-z0-9_]*)')
+
+# Databases each worker may open. Besides DB_NAME they come from the JSON
+# DB_CONFIG_FILE ({"databases": {"/data/orders.sqlite": {"pool_size": 8}}}),
+# the comma-separated DB_DATABASES, and the registry file that /api/connect
+# records into so every worker process learns about databases connected
+# through any of them. Open databases beyond DB_MAX_OPEN_DATABASES are
+# closed least recently used first, once idle for DB_EVICT_IDLE_S seconds.
+DB_CONFIG_FILE = os.environ.get('DB_CONFIG_FILE')
+DB_DATABASES = [name.strip() for name in os.environ.get('DB_DATABASES', '').split(',') if name.strip()]
+MAX_OPEN_DATABASES = int(os.environ.get('DB_MAX_OPEN_DATABASES', 32))
+EVICT_IDLE_SECONDS = float(os.environ.get('DB_EVICT_IDLE_S', 60))
+
+# With several worker processes another process may commit at any time, so
+# the query cache must also watch the file for commits it did not make
+SHARED_WRITERS = os.environ.get(
+    'DB_SHARED_WRITERS', str(int(os.environ.get('WEB_CONCURRENCY', 1)) > 1)
+).lower() == 'true'
+
+# Background maintenance per database (see MaintenanceScheduler). Tasks run
+# inside DB_MAINTENANCE_WINDOW ("HH:MM-HH:MM", any time if unset) once the
+# database has had no requests for DB_MAINTENANCE_IDLE_S seconds.
+MAINTENANCE = os.environ.get('DB_MAINTENANCE', 'true').lower() == 'true'
+MAINTENANCE_CHECK_S = float(os.environ.get('DB_MAINTENANCE_CHECK_S', 60))
+MAINTENANCE_WINDOW = os.environ.get('DB_MAINTENANCE_WINDOW', '').strip()
+MAINTENANCE_IDLE_S = float(os.environ.get('DB_MAINTENANCE_IDLE_S', 30))
+OPTIMIZE_INTERVAL_S = float(os.environ.get('DB_OPTIMIZE_INTERVAL_S', 3600))
+ANALYZE_AFTER_ROWS = int(os.environ.get('DB_ANALYZE_AFTER_ROWS', 10000))
+ANALYSIS_LIMIT = int(os.environ.get('DB_ANALYSIS_LIMIT', 1000))  # rows sampled per index, 0 scans all
+VACUUM_MIN_FREE_PAGES = int(os.environ.get('DB_VACUUM_MIN_FREE_PAGES', 256))
+VACUUM_STEP_PAGES = int(os.environ.get('DB_VACUUM_STEP_PAGES', 1000))
+MAINTENANCE_TASKS = ('optimize', 'analyze', 'incremental_vacuum', 'vacuum')
+MAINTENANCE_WINDOW_RE = re.compile(r'^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$')
+
+# Change data capture: triggers record every committed insert, update and
+# delete in CHANGE_LOG_TABLE, which keeps the newest DB_CHANGE_LOG_SIZE entries
+CHANGE_CAPTURE = os.environ.get('DB_CHANGE_CAPTURE', 'true').lower() == 'true'
+CHANGE_LOG_SIZE = int(os.environ.get('DB_CHANGE_LOG_SIZE', 100000))
+CHANGE_LOG_TABLE = '_change_log'
+CHANGE_TRIGGER_PREFIX = '_cdc_'
+CHANGE_FEED_LIMIT = 1000  # changes per /api/changes response
+CHANGE_MAX_WAIT_S = 30  # longest long-poll wait
+CHANGE_POLL_S = 0.5  # how often waiters look for commits made by other processes
+CHANGE_STREAM_MAX_S = float(os.environ.get('DB_CHANGE_STREAM_MAX_S', 300))  # SSE clients reconnect after this
+CHANGE_HEARTBEAT_S = 15
+
+# Row counters: triggers keep each table's row count in ROW_COUNT_TABLE up to
+# date on insert and delete, so unfiltered counts need no COUNT(*) scan
+ROW_COUNTERS = os.environ.get('DB_ROW_COUNTERS', 'true').lower() == 'true'
+ROW_COUNT_TABLE = '_row_counts'
+ROW_COUNT_TRIGGER_PREFIX = '_rc_'
+# Bookkeeping tables that get neither capture triggers nor row counters
+INTERNAL_TABLES = (CHANGE_LOG_TABLE, ROW_COUNT_TABLE)
+
+# Snapshot replicas serve reads sent with X-Read-Consistency: snapshot. Each
+# one is copied with the online backup API SNAPSHOT_BACKUP_PAGES pages per
+# step and refreshed every SNAPSHOT_REFRESH_S seconds if the database changed
+SNAPSHOT_REFRESH_S = float(os.environ.get('DB_SNAPSHOT_REFRESH_S', 60))
+SNAPSHOT_BACKUP_PAGES = int(os.environ.get('DB_SNAPSHOT_BACKUP_PAGES', 256))
+SNAPSHOT_BACKUP_SLEEP_MS = float(os.environ.get('DB_SNAPSHOT_BACKUP_SLEEP_MS', 5))
+SNAPSHOT_DIR = os.environ.get('DB_SNAPSHOT_DIR')  # defaults to snapshots/ next to each database
+
+# Online backups run as background jobs copying DB_BACKUP_PAGES pages per step.
+# DB_BACKUP_SCHEDULE is an interval in seconds or a daily HH:MM time; scheduled
+# backups cover DB_BACKUP_DATABASES, or every declared database if unset.
+BACKUP_DIR = os.environ.get('DB_BACKUP_DIR', 'backups')
+BACKUP_PAGES = int(os.environ.get('DB_BACKUP_PAGES', 256))
+BACKUP_SLEEP_MS = float(os.environ.get('DB_BACKUP_SLEEP_MS', 10))
+BACKUP_COMPRESS = os.environ.get('DB_BACKUP_COMPRESS', 'true').lower() == 'true'
+BACKUP_RETENTION = int(os.environ.get('DB_BACKUP_RETENTION', 7))  # newest backups kept per database, 0 keeps all
+BACKUP_SCHEDULE = os.environ.get('DB_BACKUP_SCHEDULE', '').strip()
+BACKUP_DATABASES = [name.strip() for name in os.environ.get('DB_BACKUP_DATABASES', '').split(',') if name.strip()]
+MAX_BACKUP_JOBS = 100  # finished jobs remembered for /api/backup/jobs
+BACKUP_TIME_RE = re.compile(r'^(\d{1,2}):(\d{2})$')
+
+# Analytical sessions that ATTACH several databases run on their own small
+# pool of read-only connections, so reports never hold OLTP connections
+ANALYTICS_POOL_SIZE = int(os.environ.get('DB_ANALYTICS_POOL_SIZE', 2))
+MAX_ATTACHED_DATABASES = 10
+
+# Column names accepted in ORDER BY and keyset clauses
+IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+WITHOUT_ROWID_RE = re.compile(r'\)\s*(STRICT\s*,\s*)?WITHOUT\s+ROWID\s*(,\s*STRICT\s*)?$', re.IGNORECASE)
+
+# Column changes accepted by the adjust API, e.g. {"stock_quantity": {"-=": 2}}.
+# Each "?" binds the operation's value; NULL columns count as 0 (or as the
+# value itself for max/min).
+ADJUST_OPERATORS = {
+    '=': '?',
+    '+=': 'COALESCE({col}, 0) + ?',
+    '-=': 'COALESCE({col}, 0) - ?',
+    'max': 'max(COALESCE({col}, ?), ?)',
+    'min': 'min(COALESCE({col}, ?), ?)',
+}
+
+# Result layouts accepted by the ``format`` parameter
+ROW_FORMATS = ('objects', 'columns', 'column_arrays')
+
+# Rows fetched from the cursor per step when streaming result sets
+STREAM_CHUNK_SIZE = int(os.environ.get('DB_STREAM_CHUNK_SIZE', 500))
+
+# Table export and import. Imports commit every DB_IMPORT_BATCH_SIZE rows;
+# exports are not subject to the statement time budget unless the caller
+# sends X-Statement-Timeout-Ms, but can be cancelled like any statement.
+IMPORT_BATCH_SIZE = int(os.environ.get('DB_IMPORT_BATCH_SIZE', 1000))
+MAX_IMPORT_ERRORS = 100  # failed rows reported per import
+MAX_IMPORT_HISTORY = 20  # finished imports remembered for /api/imports
+EXPORT_TIMEOUT_MS = float(os.environ.get('DB_EXPORT_TIMEOUT_MS', 0))
+IMPORT_CONFLICT_CLAUSES = {"error": "INSERT", "ignore": "INSERT OR IGNORE", "replace": "INSERT OR REPLACE"}
+
+# Keys per IN (...) list in multi-get lookups, well under SQLite's bound
+# variable limit (999 before 3.32)
+MULTI_GET_CHUNK_SIZE = int(os.environ.get('DB_MULTI_GET_CHUNK_SIZE', 500))
+
+# Cached SELECT results kept per database; 0 disables the query cache
+QUERY_CACHE_SIZE = int(os.environ.get('DB_QUERY_CACHE_SIZE', 1024))
+
+# Bare words in a statement, used to find the tables it touches
+SQL_WORD_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# SQL whose result can change without any table being written
+NON_DETERMINISTIC_RE = re.compile(
+    r"\b(random|randomblob|now|current_timestamp|current_date|current_time|"
+    r"changes|total_changes|last_insert_rowid)\b",
+    re.IGNORECASE
+)
+
+# Schema changes drop every cached result
+DDL_RE = re.compile(r'^\s*(CREATE|DROP|ALTER)\b', re.IGNORECASE)
+
+# Statements slower than this are logged with their query plan
+SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 200))
+
+# Bounds on the per-statement metrics kept in memory
+MAX_QUERY_FINGERPRINTS = int(os.environ.get('DB_MAX_QUERY_FINGERPRINTS', 500))
+LATENCY_SAMPLES = 1024
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Literal-stripping patterns used to fingerprint SQL
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+
+# Comparisons an index can serve: "col = ?", "t.col IN (...)", "col >= ?", ...
+INDEXABLE_PREDICATE_RE = re.compile(
+    r'(?:\b([A-Za-z_][A-Za-z0-9_]*)\.)?\b([A-Za-z_][A-Za-z0-9_]*)\s*(=|==|<=|>=|<|>|\bIN\b|\bIS\b)',
+    re.IGNORECASE
+)
+FILTER_CLAUSE_RE = re.compile(r'\b(WHERE|ON)\b', re.IGNORECASE)
+# Query plan lines for a full table scan, e.g. "SCAN cart_items", or a
+# throwaway index SQLite builds per query, e.g.
+# "SEARCH i USING AUTOMATIC COVERING INDEX (cart_id=?)"
+PLAN_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?([A-Za-z_][A-Za-z0-9_]*)(?: AS \S+)?$')
+PLAN_AUTOMATIC_INDEX_RE = re.compile(
+    r'^SEARCH (?:TABLE )?([A-Za-z_][A-Za-z0-9_]*).* USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \(([^)]*)\)'
+)
+# Table references with optional aliases, e.g. "FROM orders o" or "JOIN order_items AS i"
+TABLE_REFERENCE_RE = re.compile(
+    r'\b(?:FROM|JOIN|UPDATE|INTO)\s+([A-Za-z_][A-Za-z0-9_]*)(?:\s+(?:AS\s+)?([A-Za-z_][A-Za-z0-9_]*))?',
+    re.IGNORECASE
+)
+SQL_CLAUSE_WORDS = {
+    'where', 'on', 'join', 'left', 'right', 'inner', 'outer', 'cross', 'natural', 'group', 'order',
+    'limit', 'set', 'values', 'union', 'using', 'having', 'window', 'select', 'default'
+}
+
+# Per-request context (calling service, ...) visible to DatabaseManager
+query_context = threading.local()
+
+
+class StatementInterrupted(sqlite3.OperationalError):
+    """A statement stopped because it ran past its time budget or was cancelled"""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections for a single database file
+
+    Connections are opened lazily up to ``size`` and handed out to one thread
+    at a time, so concurrent requests never share a cursor. A thread that
+    already holds a connection from this pool gets the same one back, which
+    lets helpers nest inside a single transaction. Read-only pools open the
+    file with a ``mode=ro`` URI; ``pragmas`` are applied to every connection.
+    """
+
+    def __init__(self, db_name, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT,
+                 read_only=False, pragmas=None):
+        self.db_name = db_name
+        self.size = max(1, int(size))
+        self.timeout = float(timeout)
+        self.read_only = read_only
+        self.pragmas = dict(pragmas or {})
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+        # Metrics
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _create_connection(self):
+        if self.read_only:
+            uri = f"file:{pathname2url(os.path.abspath(self.db_name))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        
+        for name, value in self.pragmas.items():
+            # These are properties of the file, set by the writer
+            if name in ("journal_mode", "auto_vacuum") and self.read_only:
+                continue
+            result = conn.execute(f"PRAGMA {name} = {value}").fetchone()
+            if name == "journal_mode" and result and str(result[0]).lower() != str(value).lower():
+                logger.warning(f"{self.db_name} is using journal mode {result[0]} instead of {value}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._create_connection()
+                self._all.append(conn)
+                return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise sqlite3.OperationalError(
+                f"Timed out after {self.timeout}s waiting for a connection to {self.db_name}"
+            )
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the ``with`` block"""
+        if self._closed:
+            raise sqlite3.ProgrammingError(f"Connection pool for {self.db_name} is closed")
+
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        start = time.perf_counter()
+        conn = self._acquire()
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            # Never hand a connection back with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        """Close every connection owned by the pool"""
+        with self._lock:
+            self._closed = True
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error closing pooled connection to {self.db_name}: {e}")
+            self._all = []
+            self._idle = queue.LifoQueue()
+
+    def stats(self):
+        """Return pool usage and wait-time metrics"""
+        with self._lock:
+            return {
+                "read_only": self.read_only,
+                "size": self.size,
+                "open": len(self._all),
+                "idle": self._idle.qsize(),
+                "in_use": len(self._all) - self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+
+class QueryCache:
+    """LRU cache of SELECT results invalidated by per-table version counters
+
+    Every entry remembers the version of each table it read at the time the
+    query started. Writers bump the versions of the tables they touched after
+    committing, so a lookup that finds any version moved treats the entry as
+    stale. clear() bumps a global epoch that every entry also depends on.
+    Cached results are shared between requests and must not be mutated.
+    """
+
+    EPOCH = '*'
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def snapshot(self, tables):
+        """Current versions of the given tables, plus the global epoch"""
+        with self._lock:
+            versions = {table: self._versions.get(table, 0) for table in tables}
+            versions[self.EPOCH] = self._versions.get(self.EPOCH, 0)
+            return versions
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            result, versions = entry
+            if any(self._versions.get(table, 0) != version for table, version in versions.items()):
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result, versions):
+        with self._lock:
+            self._entries[key] = (result, versions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def bump(self, tables):
+        """Invalidate every entry that read any of the given tables"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def clear(self):
+        """Invalidate every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._versions[self.EPOCH] = self._versions.get(self.EPOCH, 0) + 1
+
+    def stats(self):
+        """Return hit/miss counters and table versions"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "max_entries": self.max_entries,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "table_versions": {t: v for t, v in self._versions.items() if t != self.EPOCH},
+            }
+
+
+class QueryStats:
+    """Per-fingerprint latency and row metrics for the statements of one database
+
+    Statements are grouped by fingerprint, their SQL with literals replaced by
+    ``?``. Each fingerprint keeps counters, a fixed-bucket latency histogram,
+    a bounded sample of recent latencies for percentiles and a count per
+    calling service. Statements slower than ``slow_query_ms`` are kept in a
+    short recent list and logged with their query plan by the caller.
+    """
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._fingerprints = {}
+        self._slow = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def _new_entry(self, fingerprint):
+        return {
+            "fingerprint": fingerprint,
+            "count": 0,
+            "errors": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "rows": 0,
+            "samples": deque(maxlen=LATENCY_SAMPLES),
+            "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            "callers": {},
+            "sample_sql": None,
+            "param_count": 0,
+        }
+
+    def record(self, query, elapsed_ms, rows=0, caller=None, error=False, param_count=0):
+        """Record one execution; returns True if it counts as slow"""
+        fingerprint = fingerprint_sql(query)
+        with self._lock:
+            entry = self._fingerprints.get(fingerprint)
+            if entry is None:
+                if len(self._fingerprints) >= MAX_QUERY_FINGERPRINTS:
+                    fingerprint = "<other>"
+                    entry = self._fingerprints.get(fingerprint)
+                if entry is None:
+                    entry = self._fingerprints[fingerprint] = self._new_entry(fingerprint)
+            
+            entry["count"] += 1
+            entry["errors"] += 1 if error else 0
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += max(rows or 0, 0)
+            entry["samples"].append(elapsed_ms)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound),
+                          len(LATENCY_BUCKETS_MS))
+            entry["histogram"][bucket] += 1
+            caller = caller or "unknown"
+            entry["callers"][caller] = entry["callers"].get(caller, 0) + 1
+            entry["sample_sql"] = query
+            entry["param_count"] = param_count
+            
+            slow = elapsed_ms >= self.slow_query_ms
+            if slow:
+                self._slow.append({
+                    "fingerprint": fingerprint,
+                    "sql": query,
+                    "elapsed_ms": round(elapsed_ms, 3),
+                    "caller": caller,
+                    "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                })
+            return slow
+
+    def hot_statements(self, min_calls=1):
+        """Recorded statements run at least ``min_calls`` times, most total time first
+        
+        Each item carries a sample of the raw SQL and its parameter count so
+        the statement can be re-planned with EXPLAIN QUERY PLAN.
+        """
+        with self._lock:
+            hot = [
+                {
+                    "fingerprint": entry["fingerprint"],
+                    "sql": entry["sample_sql"],
+                    "param_count": entry["param_count"],
+                    "count": entry["count"],
+                    "total_ms": round(entry["total_ms"], 3),
+                }
+                for entry in self._fingerprints.values()
+                if entry["count"] >= min_calls and entry["sample_sql"]
+            ]
+        hot.sort(key=lambda item: item["total_ms"], reverse=True)
+        return hot
+
+    def reset(self):
+        with self._lock:
+            self._fingerprints = {}
+            self._slow.clear()
+
+    def stats(self):
+        """Return per-fingerprint metrics, most total time first"""
+        with self._lock:
+            entries = []
+            for entry in self._fingerprints.values():
+                samples = sorted(entry["samples"])
+                entries.append({
+                    "fingerprint": entry["fingerprint"],
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "total_ms": round(entry["total_ms"], 3),
+                    "mean_ms": round(entry["total_ms"] / entry["count"], 3),
+                    "p50_ms": round(percentile(samples, 50), 3),
+                    "p95_ms": round(percentile(samples, 95), 3),
+                    "p99_ms": round(percentile(samples, 99), 3),
+                    "max_ms": round(entry["max_ms"], 3),
+                    "rows": entry["rows"],
+                    "rows_per_call": round(entry["rows"] / entry["count"], 2),
+                    "histogram": dict(zip([f"<={b}ms" for b in LATENCY_BUCKETS_MS] + ["inf"], entry["histogram"])),
+                    "callers": dict(entry["callers"]),
+                })
+            entries.sort(key=lambda e: e["total_ms"], reverse=True)
+            return {
+                "slow_query_ms": self.slow_query_ms,
+                "queries": entries,
+                "slow_queries": list(self._slow),
+            }
+
+
+class GroupCommitWriter:
+    """Dedicated writer thread that commits queued writes in groups
+
+    Callers submit a function taking a cursor and block until it has been
+    committed. The thread takes the first queued write, keeps collecting
+    more until ``max_batch`` writes are queued or ``max_wait_ms`` has passed,
+    and runs them all in one transaction, so they share a single fsync. Each
+    write runs under its own savepoint: a failing write is rolled back and
+    reported to its caller without affecting the rest of the group.
+
+    If the thread ever dies, the writes still queued fail and the next
+    submit starts a new thread. Callers stop waiting after
+    GROUP_COMMIT_SUBMIT_TIMEOUT_S.
+    """
+
+    def __init__(self, manager, max_batch=GROUP_COMMIT_MAX_BATCH, max_wait_ms=GROUP_COMMIT_MAX_WAIT_MS,
+                 submit_timeout_s=GROUP_COMMIT_SUBMIT_TIMEOUT_S):
+        self.manager = manager
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.submit_timeout = submit_timeout_s
+        self._queue = queue.Queue()
+        self._thread = self._new_thread()
+        self._stopped = False
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.groups = 0
+        self.writes = 0
+        self.failed_groups = 0
+        self.max_group = 0
+        self.restarts = 0
+
+    def _new_thread(self):
+        return threading.Thread(
+            target=self._run, name=f"writer-{os.path.basename(self.manager.db_name)}", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def submit(self, fn):
+        """Queue fn(cursor) and wait for it to be committed; returns its result"""
+        job = {
+            "fn": fn,
+            "caller": getattr(query_context, 'caller', None),
+            "timeout_ms": getattr(query_context, 'timeout_ms', STATEMENT_TIMEOUT_MS),
+            "done": threading.Event(),
+            "cancelled": False,
+            "result": None,
+            "error": None
+        }
+        with self._lock:
+            if self._stopped:
+                raise sqlite3.OperationalError(f"Writer for {self.manager.db_name} is stopped")
+            if not self._thread.is_alive():
+                logger.warning(f"Restarting the writer thread for {self.manager.db_name}")
+                self.restarts += 1
+                self._thread = self._new_thread()
+                self._thread.start()
+        self._queue.put(job)
+        if not job["done"].wait(self.submit_timeout):
+            job["cancelled"] = True
+            raise sqlite3.OperationalError(
+                f"Timed out after {self.submit_timeout:g}s waiting for the writer of {self.manager.db_name}; "
+                "the write may still be committed"
+            )
+        if job["error"] is not None:
+            raise job["error"]
+        return job["result"]
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        group = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(group) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # Finish this group, then stop
+                self._queue.put(None)
+                break
+            group.append(job)
+        return group
+
+    def _run(self):
+        group = []
+        try:
+            while True:
+                group = self._collect()
+                if group is None:
+                    return
+                self._commit_group(group)
+        except BaseException as e:
+            logger.error(f"Writer thread for {self.manager.db_name} died: {e!r}")
+            raise
+        finally:
+            # Nothing answers these callers once this thread is gone
+            error = sqlite3.OperationalError(f"Writer for {self.manager.db_name} stopped")
+            for job in group or ():
+                if not job["done"].is_set():
+                    job["result"], job["error"] = None, error
+                    job["done"].set()
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    job["error"] = error
+                    job["done"].set()
+
+    def _commit_group(self, group):
+        # Callers that timed out have already been answered
+        group = [job for job in group if not job["cancelled"]]
+        if not group:
+            return
+        try:
+            with self.manager.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN")
+                for job in group:
+                    query_context.caller = job["caller"]
+                    query_context.timeout_ms = job["timeout_ms"]
+                    cursor.execute("SAVEPOINT group_write")
+                    try:
+                        job["result"] = job["fn"](cursor)
+                        cursor.execute("RELEASE group_write")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO group_write")
+                        cursor.execute("RELEASE group_write")
+                        job["error"] = e
+                self.manager._commit(conn)
+        except Exception as e:
+            # The group as a whole failed (BEGIN or COMMIT); nothing was written
+            logger.error(f"Group commit of {len(group)} write(s) on {self.manager.db_name} failed: {e}")
+            with self._lock:
+                self.failed_groups += 1
+            for job in group:
+                job["result"] = None
+                job["error"] = e
+        finally:
+            with self._lock:
+                self.groups += 1
+                self.writes += len(group)
+                self.max_group = max(self.max_group, len(group))
+            for job in group:
+                job["done"].set()
+
+    def stats(self):
+        """Return group sizes and queue depth"""
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "queued": self._queue.qsize(),
+                "groups": self.groups,
+                "writes": self.writes,
+                "failed_groups": self.failed_groups,
+                "restarts": self.restarts,
+                "avg_group_size": round(self.writes / self.groups, 2) if self.groups else 0.0,
+                "max_group_size": self.max_group,
+            }
+
+
+class SnapshotPool(ConnectionPool):
+    """Pool of connections to a finished snapshot file, which never changes
+
+    Opening it ``immutable`` skips file locking and change detection.
+    """
+
+    def _create_connection(self):
+        uri = f"file:{pathname2url(os.path.abspath(self.db_name))}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for name in ("cache_size", "mmap_size"):
+            if name in self.pragmas:
+                conn.execute(f"PRAGMA {name} = {self.pragmas[name]}")
+        return conn
+
+
+class SnapshotReplica:
+    """Periodically refreshed read-only copy of a database for heavy reports
+
+    Each refresh copies the live file into a new generation with the online
+    backup API, a few pages per step (see online_copy), so the writer is
+    never locked out for long. Readers move to a generation as soon as it
+    is complete; the previous one is closed and deleted when its last
+    reader finishes.
+    """
+
+    def __init__(self, manager, refresh_s=SNAPSHOT_REFRESH_S, pages=SNAPSHOT_BACKUP_PAGES,
+                 sleep_ms=SNAPSHOT_BACKUP_SLEEP_MS, directory=None):
+        self.manager = manager
+        self.refresh_s = refresh_s
+        self.pages = max(1, int(pages))
+        self.sleep_ms = sleep_ms
+        self.directory = directory or SNAPSHOT_DIR or os.path.join(
+            os.path.dirname(os.path.abspath(manager.db_name)), 'snapshots'
+        )
+        # Files are per process, so several workers never share a generation
+        self.basename = os.path.splitext(os.path.basename(manager.db_name))[0]
+        self.prefix = f"{self.basename}.{os.getpid()}."
+        self._source = None
+        self._data_version = None
+        self._current = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Metrics
+        self.generations = 0
+        self.skipped = 0
+        self.failures = 0
+        self.reads = 0
+        self.last_refresh_ms = None
+        self.last_error = None
+
+    def start(self):
+        """Start taking snapshots in the background, beginning with the first one"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._remove_stale_files()
+        except OSError as e:
+            raise sqlite3.OperationalError(f"Cannot use snapshot directory {self.directory}: {e}")
+        uri = f"file:{pathname2url(os.path.abspath(self.manager.db_name))}?mode=ro"
+        self._source = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._thread = threading.Thread(
+            target=self._run, name=f"snapshot-{self.manager.db_name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._refresh_lock:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+        with self._lock:
+            current, self._current = self._current, None
+        if current is not None:
+            self._retire(current)
+
+    def _remove_stale_files(self):
+        """Delete generations left behind by processes that no longer exist"""
+        base = self.basename + '.'
+        for filename in os.listdir(self.directory):
+            parts = filename[len(base):].split('.')
+            if not filename.startswith(base) or len(parts) != 3 or not parts[0].isdigit():
+                continue
+            pid = int(parts[0])
+            if pid != os.getpid():
+                try:
+                    os.kill(pid, 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except PermissionError:
+                    continue
+            os.remove(os.path.join(self.directory, filename))
+
+    def _run(self):
+        # The first generation is taken here too, so no request waits for the copy
+        delay = 0
+        while not self._stop.wait(delay):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing snapshot of {self.manager.db_name}: {e}")
+            if self.refresh_s <= 0:
+                return
+            delay = self.refresh_s
+
+    def refresh(self, force=False):
+        """Copy the database into a new generation if it changed since the last one
+        
+        Args:
+            force (bool, optional): Copy even if nothing was committed
+        
+        Returns:
+            bool: Whether a new generation was taken
+        """
+        with self._refresh_lock:
+            if self._source is None:
+                raise sqlite3.ProgrammingError(f"Snapshots of {self.manager.db_name} are stopped")
+            version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            if not force and self._current is not None and version == self._data_version:
+                self.skipped += 1
+                return False
+            
+            path = os.path.join(self.directory, f"{self.prefix}{self.generations + 1}.sqlite")
+            start = time.perf_counter()
+            taken_at = datetime.now()
+            try:
+                online_copy(self._source, path, self.pages, self.sleep_ms)
+            except sqlite3.Error as e:
+                if os.path.exists(path):
+                    os.remove(path)
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            
+            self.generations += 1
+            self._data_version = version
+            self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 3)
+            self.last_error = None
+            generation = {
+                "id": self.generations,
+                "path": path,
+                "taken_at": taken_at,
+                "pool": SnapshotPool(path, self.manager.pool_size, self.manager.pool_timeout,
+                                     read_only=True, pragmas=self.manager.pragmas),
+                "readers": 0
+            }
+            with self._lock:
+                previous, self._current = self._current, generation
+                retire = previous is not None and previous["readers"] == 0
+            if retire:
+                self._retire(previous)
+            logger.info(f"Snapshot {generation['id']} of {self.manager.db_name} taken in {self.last_refresh_ms} ms")
+            return True
+
+    def _retire(self, generation):
+        generation["pool"].close()
+        try:
+            os.remove(generation["path"])
+        except OSError as e:
+            logger.warning(f"Error removing snapshot file {generation['path']}: {e}")
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection to the newest complete generation"""
+        with self._lock:
+            generation = self._current
+            if generation is None:
+                raise sqlite3.ProgrammingError(f"Snapshots of {self.manager.db_name} are stopped")
+            generation["readers"] += 1
+            self.reads += 1
+        query_context.snapshot_taken_at = generation["taken_at"].isoformat()
+        try:
+            with generation["pool"].connection() as conn:
+                yield conn
+        finally:
+            with self._lock:
+                generation["readers"] -= 1
+                retire = generation is not self._current and generation["readers"] == 0
+            if retire:
+                self._retire(generation)
+
+    def ready(self):
+        """Whether a generation is available to read"""
+        with self._lock:
+            return self._current is not None
+
+    def busy(self):
+        with self._lock:
+            return self._current is not None and self._current["readers"] > 0
+
+    def stats(self):
+        """Return the current generation's age and refresh metrics"""
+        with self._lock:
+            current = self._current
+            readers = current["readers"] if current else 0
+        size = None
+        if current is not None:
+            try:
+                size = os.path.getsize(current["path"])
+            except OSError:
+                pass
+        return {
+            "generation": current["id"] if current else None,
+            "taken_at": current["taken_at"].isoformat() if current else None,
+            "age_s": round((datetime.now() - current["taken_at"]).total_seconds(), 3) if current else None,
+            "size_bytes": size,
+            "refresh_s": self.refresh_s,
+            "pages_per_step": self.pages,
+            "last_refresh_ms": self.last_refresh_ms,
+            "skipped_refreshes": self.skipped,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "reads": self.reads,
+            "active_readers": readers
+        }
+
+
+class MaintenanceScheduler:
+    """Background upkeep of one database during quiet periods
+    
+    Every ``check_s`` seconds, if the database is inside its maintenance
+    window and has been idle for ``idle_s``, due tasks run on the writer
+    pool, one short statement at a time:
+    
+    - ``optimize``: PRAGMA optimize every ``optimize_interval_s``
+    - ``analyze``: ANALYZE once ``analyze_after_rows`` rows were written
+      since the last one, or if the database was never analyzed
+    - ``incremental_vacuum``: return free pages to the file system in steps
+      of VACUUM_STEP_PAGES when auto_vacuum is INCREMENTAL
+    
+    A full ``vacuum`` only runs on request. Writes are counted from the
+    writer connections' total_changes, so each worker process counts its
+    own writes.
+    """
+
+    def __init__(self, manager, check_s=MAINTENANCE_CHECK_S, window=MAINTENANCE_WINDOW,
+                 idle_s=MAINTENANCE_IDLE_S, optimize_interval_s=OPTIMIZE_INTERVAL_S,
+                 analyze_after_rows=ANALYZE_AFTER_ROWS):
+        self.manager = manager
+        self.check_s = check_s
+        self.window = parse_time_window(window) if window else None
+        self.window_text = window or None
+        self.idle_s = idle_s
+        self.optimize_interval_s = optimize_interval_s
+        self.analyze_after_rows = analyze_after_rows
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+        self._changes_at_analyze = 0
+        self._last_optimize = None
+        
+        # Metrics
+        self.tasks = {
+            name: {"runs": 0, "last_run": None, "last_duration_ms": None, "last_result": None, "last_error": None}
+            for name in MAINTENANCE_TASKS
+        }
+        self.history = deque(maxlen=20)
+        self.last_check = None
+        self.last_deferred = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f"maintenance-{self.manager.db_name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.check_s):
+            try:
+                self.run_due()
+            except Exception as e:
+                # Keep the thread alive; the next check tries again
+                logger.error(f"Error during maintenance of {self.manager.db_name}: {e!r}")
+
+    def _rows_written(self):
+        """Rows changed through this process's writer connections"""
+        return sum(conn.total_changes for conn in list(self.manager.pool._all))
+
+    def _quiet(self):
+        """Why maintenance should wait, or None if now is a good time"""
+        if self.window is not None and not in_time_window(self.window):
+            return "outside maintenance window"
+        if time.monotonic() - self.manager.last_used < self.idle_s or self.manager.busy():
+            return "database in use"
+        return None
+
+    def _due(self):
+        due = []
+        if self._last_optimize is None or time.monotonic() - self._last_optimize >= self.optimize_interval_s:
+            due.append("optimize")
+        with self.manager.read_pool.connection() as conn:
+            analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not analyzed or self._rows_written() - self._changes_at_analyze >= self.analyze_after_rows:
+            due.append("analyze")
+        if auto_vacuum == 2 and free_pages >= VACUUM_MIN_FREE_PAGES:
+            due.append("incremental_vacuum")
+        return due
+
+    def run_due(self):
+        """Run the tasks that are due if the database is quiet"""
+        self.last_check = datetime.now().isoformat()
+        reason = self._quiet()
+        if reason is not None:
+            self.last_deferred = reason
+            return []
+        self.last_deferred = None
+        results = []
+        for task in self._due():
+            if self._stop.is_set() or self._quiet() is not None:
+                break
+            results.append(self.run_task(task, trigger="schedule"))
+        return results
+
+    def run_task(self, task, trigger="api"):
+        """Run one maintenance task now and record its outcome
+        
+        Args:
+            task (str): One of MAINTENANCE_TASKS
+            trigger (str, optional): What started it, for the history
+        """
+        if task not in MAINTENANCE_TASKS:
+            raise ValueError(f"Unknown maintenance task {task}; use one of {', '.join(MAINTENANCE_TASKS)}")
+        
+        start = time.perf_counter()
+        entry = {"task": task, "trigger": trigger, "at": datetime.now().isoformat()}
+        try:
+            with self._run_lock:
+                result = getattr(self, f"_{task}")()
+            entry["result"] = result
+        except sqlite3.Error as e:
+            entry["error"] = str(e)
+            logger.error(f"Maintenance task {task} failed on {self.manager.db_name}: {e}")
+        entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        
+        stats = self.tasks[task]
+        stats["runs"] += 1
+        stats["last_run"] = entry["at"]
+        stats["last_duration_ms"] = entry["duration_ms"]
+        stats["last_result"] = entry.get("result")
+        stats["last_error"] = entry.get("error")
+        self.history.append(entry)
+        return entry
+
+    # Python's execute() steps a PRAGMA only once, which frees a single page
+    # for incremental_vacuum, so the maintenance pragmas use executescript()
+
+    def _optimize(self):
+        with self.manager.pool.connection() as conn:
+            conn.executescript(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}; PRAGMA optimize;")
+        self._last_optimize = time.monotonic()
+        return "optimized"
+
+    def _analyze(self):
+        changes = self._rows_written()
+        with self.manager.pool.connection() as conn:
+            conn.executescript(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}; ANALYZE;")
+        written, self._changes_at_analyze = changes - self._changes_at_analyze, changes
+        return f"analyzed after {written} rows written"
+
+    def _incremental_vacuum(self):
+        freed = 0
+        while not self._stop.is_set():
+            with self.manager.pool.connection() as conn:
+                before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if before == 0:
+                    break
+                conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});")
+                after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            freed += before - after
+            # Give writers a turn between steps and stop if traffic resumed
+            if after == 0 or self._quiet() is not None:
+                break
+        return f"freed {freed} pages"
+
+    def _vacuum(self):
+        with self.manager.pool.connection() as conn:
+            before = conn.execute("PRAGMA page_count").fetchone()[0]
+            conn.executescript("VACUUM;")
+            after = conn.execute("PRAGMA page_count").fetchone()[0]
+        return f"rebuilt from {before} to {after} pages"
+
+    def status(self):
+        """Return the file's space usage, task outcomes and recent runs"""
+        with self.manager.read_pool.connection() as conn:
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+        return {
+            "window": self.window_text,
+            "idle_s": self.idle_s,
+            "check_s": self.check_s,
+            "last_check": self.last_check,
+            "deferred": self.last_deferred,
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(auto_vacuum, auto_vacuum),
+            "page_count": page_count,
+            "size_bytes": page_count * page_size,
+            "free_pages": free_pages,
+            "analyzed": bool(analyzed),
+            "rows_written_since_analyze": self._rows_written() - self._changes_at_analyze,
+            "analyze_after_rows": self.analyze_after_rows,
+            "tasks": {name: dict(stats) for name, stats in self.tasks.items()},
+            "history": list(self.history)
+        }
+
+
 class DatabaseManager:
-    def __init__(self, db_name=None):
+    def __init__(self, db_name=None, pool_size=DEFAULT_POOL_SIZE, pool_timeout=DEFAULT_POOL_TIMEOUT,
+                 query_cache_size=QUERY_CACHE_SIZE, slow_query_ms=SLOW_QUERY_MS,
+                 write_pool_size=DEFAULT_WRITE_POOL_SIZE, pragmas=None, group_commit=GROUP_COMMIT,
+                 group_commit_max_batch=GROUP_COMMIT_MAX_BATCH, group_commit_max_wait_ms=GROUP_COMMIT_MAX_WAIT_MS,
+                 shared_writers=SHARED_WRITERS, snapshot_refresh_s=SNAPSHOT_REFRESH_S,
+                 maintenance=MAINTENANCE, change_capture=CHANGE_CAPTURE, row_counters=ROW_COUNTERS):
         """Initialize the database manager with an optional database name"""
         if db_name is None:
             self.db_name = "ecommerce.sqlite"
         else:
             self.db_name = db_name if db_name.endswith('.sqlite') else f"{db_name}.sqlite"
         
-        self.conn = None
-        self.cursor = None
+        self.pool_size = pool_size
+        self.write_pool_size = write_pool_size
+        self.pool_timeout = pool_timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        for name, value in (pragmas or {}).items():
+            if name not in DEFAULT_PRAGMAS or not PRAGMA_VALUE_RE.match(str(value)):
+                raise ValueError(f"Unsupported pragma setting {name}={value}")
+            self.pragmas[name] = value
+        
+        # Writes and anything needing a transaction use ``pool``; plain reads
+        # use ``read_pool`` so they run concurrently with the writer under WAL
+        self.pool = None
+        self.read_pool = None
         self.connected = False
+        
+        self.group_commit = group_commit
+        self.group_commit_max_batch = group_commit_max_batch
+        self.group_commit_max_wait_ms = group_commit_max_wait_ms
+        self.writer = None
+        
+        self.cache = QueryCache(query_cache_size)
+        self.query_stats = QueryStats(slow_query_ms)
+        
+        # Other processes' commits are detected through PRAGMA data_version
+        # on a connection of our own, which changes whenever anyone commits
+        self.shared_writers = shared_writers
+        self._watch = None
+        self._watch_lock = threading.Lock()
+        self._data_version = None
+        self.last_used = time.monotonic()
+        self._schema = None
+        self._schema_lock = threading.Lock()
+        self._writes = threading.local()
+        
+        # Statements currently executing, by id, for /api/queries/running
+        self._running = {}
+        self._running_lock = threading.Lock()
+        self.timeouts = 0
+        self.cancellations = 0
+        
+        # Queries registered by name through /api/queries/<name>
+        self.named_queries = {}
+        self._named_lock = threading.Lock()
+        
+        # Snapshot replica, started by the first snapshot read
+        self.snapshot_refresh_s = snapshot_refresh_s
+        self.snapshot = None
+        self._snapshot_lock = threading.Lock()
+        
+        # ANALYZE, PRAGMA optimize and incremental vacuum in quiet periods
+        self.maintenance_enabled = maintenance
+        self.maintenance = None
+        
+        # Imports through /api/tables/<table>/import, for progress reporting
+        self._imports = OrderedDict()
+        self._imports_lock = threading.Lock()
+        
+        # Change feed waiters sleep on _changes_cond until a commit bumps _commits
+        self.change_capture = change_capture
+        self._changes_cond = threading.Condition()
+        self._commits = 0
+        
+        # Per-table row counts maintained by triggers, see count_rows
+        self.row_counters = row_counters
 
     def connect(self):
         """Connect to the database"""
+        if self.connected:
+            return {"status": "success", "message": f"Connected to {self.db_name} successfully"}
+
         try:
-            self.conn = sqlite3.connect(self.db_name)
-            self.conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-            self.cursor = self.conn.cursor()
+            pool = ConnectionPool(self.db_name, self.write_pool_size, self.pool_timeout,
+                                  pragmas=self.pragmas)
+            # Open the first connections eagerly so bad paths fail here. The
+            # writer goes first: it creates the file and switches it to WAL.
+            with pool.connection():
+                pass
+            read_pool = ConnectionPool(self.db_name, self.pool_size, self.pool_timeout,
+                                       read_only=True, pragmas=self.pragmas)
+            try:
+                with read_pool.connection():
+                    pass
+            except sqlite3.Error:
+                pool.close()
+                raise
+            self.pool = pool
+            self.read_pool = read_pool
+            if self.change_capture or self.row_counters:
+                with pool.connection() as conn:
+                    if self.change_capture:
+                        self._install_change_capture(conn)
+                    if self.row_counters:
+                        self._install_row_counters(conn)
+            if self.shared_writers:
+                self._watch = read_pool._create_connection()
+                self._data_version = None
+            if self.group_commit:
+                self.writer = GroupCommitWriter(self, self.group_commit_max_batch, self.group_commit_max_wait_ms)
+                self.writer.start()
+            if self.maintenance_enabled:
+                try:
+                    self.maintenance = MaintenanceScheduler(self)
+                    self.maintenance.start()
+                except ValueError as e:
+                    logger.error(f"Maintenance disabled for {self.db_name}: {e}")
             self.connected = True
             logger.info(f"Connected to {self.db_name} successfully")
             return {"status": "success", "message": f"Connected to {self.db_name} successfully"}
@@ -49,351 +1326,3343 @@ class DatabaseManager:
     def disconnect(self):
         """Close the database connection"""
         if self.connected:
-            self.conn.close()
+            if self.writer is not None:
+                self.writer.stop()
+                self.writer = None
+            if self.maintenance is not None:
+                self.maintenance.stop()
+                self.maintenance = None
+            with self._snapshot_lock:
+                if self.snapshot is not None:
+                    self.snapshot.stop()
+                    self.snapshot = None
+            self.pool.close()
+            self.read_pool.close()
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+            self.pool = None
+            self.read_pool = None
             self.connected = False
             logger.info("Disconnected from database")
             return {"status": "success", "message": "Disconnected from database"}
         return {"status": "info", "message": "Not connected to any database"}
     
-    def execute_query(self, query, params=None):
-        """Execute a query and return results if any"""
+    def busy(self):
+        """Whether any connection is checked out or any write is queued"""
         if not self.connected:
-            return {"status": "error", "message": "Not connected to database. Connect first."}
+            return False
+        if self.pool.stats()["in_use"] or self.read_pool.stats()["in_use"]:
+            return True
+        if self.snapshot is not None and self.snapshot.busy():
+            return True
+        return self.writer is not None and self.writer.stats()["queued"] > 0
+    
+    # Table tracking for the query cache. Writes are recorded per thread while
+    # a transaction is open and only bump table versions once it commits.
+
+    def _load_schema(self, conn):
+        """Map table, view and trigger names to the tables they depend on"""
+        with self._schema_lock:
+            if self._schema is not None:
+                return self._schema
+            
+            rows = conn.execute(
+                "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('table', 'view', 'trigger')"
+            ).fetchall()
+            tables = {row[1].lower() for row in rows if row[0] == 'table'}
+            views = {row[1].lower(): row[3] or '' for row in rows if row[0] == 'view'}
+            known = tables | set(views)
+            
+            schema = {
+                "tables": tables,
+                "views": {name: sql_words(sql) & known for name, sql in views.items()},
+                "triggers": {}
+            }
+            for row in rows:
+                if row[0] == 'trigger':
+                    schema["triggers"].setdefault(row[2].lower(), set()).update(sql_words(row[3] or '') & known)
+            self._schema = schema
+            return schema
+
+    def _expand_views(self, schema, names):
+        tables = set()
+        pending = list(names)
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            if name in schema["views"]:
+                pending.extend(schema["views"][name])
+            elif name in schema["tables"]:
+                tables.add(name)
+        return tables
+
+    def _tables_read_by(self, conn, query):
+        """Tables a statement may read, over-approximated from its words"""
+        schema = self._load_schema(conn)
+        return self._expand_views(schema, sql_words(query))
+
+    def _mark_written(self, *tables):
+        pending = getattr(self._writes, 'tables', None)
+        if pending is None:
+            pending = self._writes.tables = set()
+        pending.update(table.lower() for table in tables)
+
+    def _mark_written_by(self, query):
+        if DDL_RE.match(query):
+            self._mark_written(QueryCache.EPOCH)
+        else:
+            self._mark_written(*sql_words(query))
+
+    def _commit(self, conn):
+        """Commit the open transaction and invalidate the tables it wrote"""
+        if conn.in_transaction:
+            conn.commit()
         
+        pending = getattr(self._writes, 'tables', None)
+        if not pending:
+            return
+        self._writes.tables = None
+        with self._changes_cond:
+            self._commits += 1
+            self._changes_cond.notify_all()
+        
+        if QueryCache.EPOCH in pending:
+            if self.change_capture:
+                self._install_change_capture(conn)
+            if self.row_counters:
+                self._install_row_counters(conn)
+            with self._schema_lock:
+                self._schema = None
+            self.cache.clear()
+            return
+        
+        # Include tables written by triggers on the tables we wrote
+        schema = self._load_schema(conn)
+        written = set()
+        queue_ = list(self._expand_views(schema, pending))
+        while queue_:
+            table = queue_.pop()
+            if table in written:
+                continue
+            written.add(table)
+            queue_.extend(self._expand_views(schema, schema["triggers"].get(table, ())))
+        self.cache.bump(written)
+
+    def _install_change_capture(self, conn):
+        """Create the change log and capture triggers for tables that lack them
+        
+        Runs at connect and after every committed schema change. Each table
+        gets one trigger per operation that logs the row's primary key (its
+        rowid if it has none) as JSON. An update that changes the key also
+        logs a delete of the old key. Triggers left over from renamed
+        tables are dropped. Failures are logged, never raised, since the
+        schema change that caused the call has already committed.
+        """
         try:
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
+            rows = conn.execute(
+                "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('table', 'trigger')"
+            ).fetchall()
+            names = {row[1] for row in rows}
+            statements = []
+            if CHANGE_LOG_TABLE not in names:
+                statements.append(
+                    f"CREATE TABLE {CHANGE_LOG_TABLE} ("
+                    "seq INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT NOT NULL, row_key TEXT, "
+                    "op TEXT NOT NULL, changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')))"
+                )
+            # Recreated every time so a new DB_CHANGE_LOG_SIZE takes effect
+            statements.append(f"DROP TRIGGER IF EXISTS {CHANGE_LOG_TABLE}_prune")
+            statements.append(
+                f"CREATE TRIGGER {CHANGE_LOG_TABLE}_prune AFTER INSERT ON {CHANGE_LOG_TABLE} "
+                f"WHEN NEW.seq % 1000 = 0 BEGIN "
+                f"DELETE FROM {CHANGE_LOG_TABLE} WHERE seq <= NEW.seq - {max(1000, CHANGE_LOG_SIZE)}; END"
+            )
             
-            # If the query might return results (SELECT)
-            if query.strip().upper().startswith("SELECT"):
-                results = self.cursor.fetchall()
+            expected = set()
+            for table in user_tables(rows):
+                columns = conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall()
+                keys = [col[1] for col in sorted(columns, key=lambda col: col[5]) if col[5] > 0] or ['rowid']
                 
-                # Format results as a list of dictionaries
-                formatted_results = []
-                for row in results:
-                    formatted_results.append(dict(row))
+                def key_of(alias):
+                    if len(keys) == 1:
+                        return f"json_quote({alias}.{quote_identifier(keys[0])})"
+                    return f"json_array({', '.join(f'{alias}.{quote_identifier(key)}' for key in keys)})"
                 
-                return {
-                    "status": "success", 
-                    "message": f"Query executed successfully. Retrieved {len(formatted_results)} rows.",
-                    "data": formatted_results
-                }
-            else:
-                self.conn.commit()
-                return {
-                    "status": "success", 
-                    "message": f"Query executed successfully. {self.cursor.rowcount} rows affected.",
-                    "rows_affected": self.cursor.rowcount
+                log = f"INSERT INTO {CHANGE_LOG_TABLE} (table_name, row_key, op)"
+                literal = "'" + table.replace("'", "''") + "'"
+                bodies = {
+                    "insert": f"{log} VALUES ({literal}, {key_of('NEW')}, 'insert');",
+                    "update": f"{log} VALUES ({literal}, {key_of('NEW')}, 'update'); "
+                              f"{log} SELECT {literal}, {key_of('OLD')}, 'delete' "
+                              f"WHERE {key_of('OLD')} IS NOT {key_of('NEW')};",
+                    "delete": f"{log} VALUES ({literal}, {key_of('OLD')}, 'delete');",
                 }
+                for op, body in bodies.items():
+                    trigger = f"{CHANGE_TRIGGER_PREFIX}{table}_{op}"
+                    expected.add(trigger)
+                    if trigger not in names:
+                        statements.append(
+                            f"CREATE TRIGGER {quote_identifier(trigger)} AFTER {op.upper()} "
+                            f"ON {quote_identifier(table)} BEGIN {body} END"
+                        )
+            for row in rows:
+                if row[0] == 'trigger' and row[1].startswith(CHANGE_TRIGGER_PREFIX) and row[1] not in expected:
+                    statements.append(f"DROP TRIGGER IF EXISTS {quote_identifier(row[1])}")
+            
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.commit()
         except sqlite3.Error as e:
-            error_msg = f"Error executing query: {e}"
-            logger.error(error_msg)
-            return {"status": "error", "message": error_msg}
-    
-    def create_table(self, table_name, columns):
-        """Create a new table with specified columns
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Error installing change capture on {self.db_name}: {e}")
+
+    def _install_row_counters(self, conn):
+        """Create the row count table and counting triggers for tables that lack them
         
-        Args:
-            table_name (str): Name of the table to create
-            columns (dict): Dictionary of column names and their data types/constraints
-                Example: {"id": "INTEGER PRIMARY KEY", "name": "TEXT NOT NULL"}
+        Runs next to _install_change_capture. A table missing either of its
+        triggers (new, renamed, or dropped and recreated) is counted once in
+        the same transaction that creates them, so its counter is exact from
+        then on. Counters and triggers of tables that no longer exist are
+        dropped. Failures are logged, never raised.
         """
-        if not self.connected:
-            return {"status": "error", "message": "Not connected to database. Connect first."}
-        
         try:
-            # Construct the CREATE TABLE query
-            col_defs = [f"{col_name} {col_def}" for col_name, col_def in columns.items()]
-            col_defs_str = ", ".join(col_defs)
-            query = f"CREATE TABLE IF NOT EXISTS {table_name} ({col_defs_str})"
+            # IMMEDIATE so no other writer commits between the count and the triggers
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('table', 'trigger')"
+            ).fetchall()
+            names = {row[1] for row in rows}
+            if ROW_COUNT_TABLE not in names:
+                conn.execute(
+                    f"CREATE TABLE {ROW_COUNT_TABLE} ("
+                    "table_name TEXT PRIMARY KEY, row_count INTEGER NOT NULL) WITHOUT ROWID"
+                )
             
-            # Execute the query
-            self.cursor.execute(query)
-            self.conn.commit()
-            logger.info(f"Table '{table_name}' created successfully")
-            return {"status": "success", "message": f"Table '{table_name}' created successfully"}
+            expected = set()
+            for table in user_tables(rows):
+                literal = "'" + table.replace("'", "''") + "'"
+                triggers = {op: f"{ROW_COUNT_TRIGGER_PREFIX}{table}_{op}" for op in ("insert", "delete")}
+                expected.update(triggers.values())
+                if all(trigger in names for trigger in triggers.values()):
+                    continue
+                for op, trigger in triggers.items():
+                    delta = "+ 1" if op == "insert" else "- 1"
+                    conn.execute(f"DROP TRIGGER IF EXISTS {quote_identifier(trigger)}")
+                    conn.execute(
+                        f"CREATE TRIGGER {quote_identifier(trigger)} AFTER {op.upper()} ON {quote_identifier(table)} "
+                        f"BEGIN UPDATE {ROW_COUNT_TABLE} SET row_count = row_count {delta} "
+                        f"WHERE table_name = {literal}; END"
+                    )
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {ROW_COUNT_TABLE} (table_name, row_count) "
+                    f"SELECT ?, count(*) FROM {quote_identifier(table)}", (table,)
+                )
+            for row in rows:
+                if row[0] == 'trigger' and row[1].startswith(ROW_COUNT_TRIGGER_PREFIX) and row[1] not in expected:
+                    conn.execute(f"DROP TRIGGER IF EXISTS {quote_identifier(row[1])}")
+            conn.execute(
+                f"DELETE FROM {ROW_COUNT_TABLE} "
+                "WHERE table_name NOT IN (SELECT name FROM sqlite_master WHERE type = 'table')"
+            )
+            conn.commit()
         except sqlite3.Error as e:
-            error_msg = f"Error creating table: {e}"
-            logger.error(error_msg)
-            return {"status": "error", "message": error_msg}
-    
-    def insert_data(self, table_name, data):
-        """Insert data into a table
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Error installing row counters on {self.db_name}: {e}")
+
+    def _write(self, fn):
+        """Run fn(cursor) in a committed transaction and return its result
         
-        Args:
-            table_name (str): Name of the target table
-            data (dict): Dictionary of column names and values to insert
+        With group commit enabled the write is handed to the writer thread
+        and shares a transaction with other concurrent writes.
         """
-        if not self.connected:
-            return {"status": "error", "message": "Not connected to database. Connect first."}
+        if self.writer is not None:
+            return self.writer.submit(fn)
         
-        try:
-            columns = list(data.keys())
-            values = list(data.values())
-            placeholders = ", ".join(["?"] * len(columns))
-            
-            query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
-            self.cursor.execute(query, values)
-            self.conn.commit()
-            logger.info(f"Data inserted into '{table_name}' successfully")
-            return {
-                "status": "success", 
-                "message": f"Data inserted into '{table_name}' successfully",
-                "last_row_id": self.cursor.lastrowid
-            }
-        except sqlite3.Error as e:
-            error_msg = f"Error inserting data: {e}"
-            logger.error(error_msg)
+        with self.pool.connection() as conn:
+            result = fn(conn.cursor())
+            self._commit(conn)
+        return result
+
+    def _sync_external_writes(self):
+        """Drop cached results and schema if the file changed since the last check
+        
+        Only used with shared writers. data_version cannot tell our commits
+        from another process's, so any commit invalidates the whole cache.
+        """
+        with self._watch_lock:
+            if self._watch is None:
+                return
+            version = self._watch.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            self._data_version = version
+        with self._schema_lock:
+            self._schema = None
+        self.cache.clear()
+
+    def _reader(self):
+        """Pool for plain reads: the live file, or the snapshot replica when the
+        request asked for X-Read-Consistency: snapshot"""
+        if getattr(query_context, 'read_consistency', None) != 'snapshot':
+            return self.read_pool
+        replica = self.snapshot_replica()
+        # Until the first generation is ready, snapshot reads see the live file
+        return replica if replica.ready() else self.read_pool
+
+    def snapshot_replica(self):
+        """Return this database's snapshot replica, starting it if needed
+        
+        The first generation is copied in the background; see _reader.
+        """
+        with self._snapshot_lock:
+            if self.snapshot is None:
+                replica = SnapshotReplica(self, self.snapshot_refresh_s)
+                replica.start()
+                self.snapshot = replica
+            return self.snapshot
+
+    def _cached_read(self, query, params, row_format, run):
+        """Serve a SELECT from the query cache, running it on a miss
+        
+        Args:
+            query (str): The SQL that ``run`` executes
+            params: Its parameters
+            row_format (str): Result layout, part of the cache key
+            run (callable): Takes a checked-out connection, returns the result
+        """
+        reader = self._reader()
+        if reader is not self.read_pool:
+            # Snapshot results are already stale by design; keep them out of the cache
+            with reader.connection() as conn:
+                return run(conn)
+        
+        if self.shared_writers:
+            self._sync_external_writes()
+        
+        key = None
+        if self.cache.enabled and not NON_DETERMINISTIC_RE.search(query):
+            try:
+                key = (" ".join(query.split()), tuple(params) if params else (), row_format)
+                hash(key)
+            except TypeError:
+                key = None
+        
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        with self.read_pool.connection() as conn:
+            if key is None:
+                return run(conn)
+            
+            tables = self._tables_read_by(conn, query)
+            versions = self.cache.snapshot(tables)
+            result = run(conn)
+        
+        if tables and result.get('status') == 'success':
+            self.cache.put(key, result, versions)
+        return result
+
+    # Statement helpers. Each runs on a cursor the caller already checked out
+    # and leaves committing to the caller, so single calls and batches share them.
+
+    @contextmanager
+    def _time_budget(self, conn, query):
+        """Register a running statement and interrupt it once over budget
+        
+        The budget comes from the request context (see bind_query_context).
+        SQLite calls the progress handler every PROGRESS_HANDLER_STEPS VM
+        instructions; returning non-zero aborts the statement, which is then
+        reported as a StatementInterrupted error.
+        """
+        budget_ms = getattr(query_context, 'timeout_ms', STATEMENT_TIMEOUT_MS)
+        entry = {
+            "id": uuid.uuid4().hex[:12],
+            "sql": query,
+            "caller": getattr(query_context, 'caller', None),
+            "started_at": datetime.now().isoformat(),
+            "timeout_ms": budget_ms or None,
+            "cancelled": False,
+            "start": time.monotonic()
+        }
+        deadline = entry["start"] + budget_ms / 1000 if budget_ms else None
+        
+        def check():
+            if entry["cancelled"] or (deadline is not None and time.monotonic() > deadline):
+                return 1
+            return 0
+        
+        with self._running_lock:
+            self._running[entry["id"]] = entry
+        conn.set_progress_handler(check, PROGRESS_HANDLER_STEPS)
+        try:
+            yield entry
+        except sqlite3.OperationalError as e:
+            if isinstance(e, StatementInterrupted) or 'interrupted' not in str(e):
+                raise
+            if entry["cancelled"]:
+                with self._running_lock:
+                    self.cancellations += 1
+                raise StatementInterrupted(f"Statement {entry['id']} was cancelled", "cancelled") from e
+            with self._running_lock:
+                self.timeouts += 1
+            raise StatementInterrupted(
+                f"Statement exceeded its time budget of {budget_ms:g} ms and was stopped", "timeout"
+            ) from e
+        finally:
+            conn.set_progress_handler(None, 0)
+            with self._running_lock:
+                self._running.pop(entry["id"], None)
+
+    def running_statements(self):
+        """List the statements currently executing on this database"""
+        now = time.monotonic()
+        with self._running_lock:
+            return [
+                {
+                    "id": entry["id"],
+                    "sql": entry["sql"],
+                    "caller": entry["caller"],
+                    "started_at": entry["started_at"],
+                    "elapsed_ms": round((now - entry["start"]) * 1000, 1),
+                    "timeout_ms": entry["timeout_ms"],
+                    "cancelled": entry["cancelled"]
+                }
+                for entry in self._running.values()
+            ]
+
+    def cancel_statement(self, statement_id):
+        """Ask a running statement to stop; returns False if it is not running"""
+        with self._running_lock:
+            entry = self._running.get(statement_id)
+            if entry is None:
+                return False
+            entry["cancelled"] = True
+        return True
+
+    def _run_statement(self, cursor, query, params=None, fetch=False, many=False):
+        """Execute one statement and record its latency in the query metrics
+        
+        Returns the fetched rows when ``fetch`` is set, otherwise None.
+        """
+        start = time.perf_counter()
+        rows = None
+        try:
+            with self._time_budget(cursor.connection, query):
+                if many:
+                    cursor.executemany(query, params)
+                elif params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                if fetch:
+                    rows = cursor.fetchall()
+        except sqlite3.Error:
+            self._record_statement(cursor, query, params, start, 0, error=True, many=many)
+            raise
+        
+        self._record_statement(cursor, query, params, start,
+                               len(rows) if rows is not None else cursor.rowcount, many=many)
+        return rows
+
+    def _record_statement(self, cursor, query, params, start, rows, error=False, many=False):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        caller = getattr(query_context, 'caller', None)
+        if many:
+            params = params[0] if params else None
+        param_count = len(params) if isinstance(params, (list, tuple)) else 0
+        slow = self.query_stats.record(query, elapsed_ms, rows, caller, error, param_count)
+        if slow:
+            logger.warning(
+                f"Slow query on {self.db_name} ({elapsed_ms:.1f} ms, caller {caller}): {query} "
+                f"params={params} plan={self._query_plan(cursor, query, params)}"
+            )
+
+    def _query_plan(self, cursor, query, params=None):
+        try:
+            plan = cursor.connection.execute(f"EXPLAIN QUERY PLAN {query}", params or ()).fetchall()
+            return [row[3] for row in plan]
+        except sqlite3.Error as e:
+            return f"unavailable ({e})"
+
+    def _execute(self, cursor, query, params=None, row_format="objects"):
+        # If the query might return results (SELECT)
+        is_select = query.strip().upper().startswith("SELECT")
+        rows = self._run_statement(cursor, query, params, fetch=is_select)
+        
+        if is_select:
+            result = {
+                "status": "success", 
+                "message": f"Query executed successfully. Retrieved {len(rows)} rows."
+            }
+            result.update(format_rows(cursor.description, rows, row_format))
+            return result
+        self._mark_written_by(query)
+        return {
+            "status": "success", 
+            "message": f"Query executed successfully. {cursor.rowcount} rows affected.",
+            "rows_affected": cursor.rowcount
+        }
+
+    def _insert(self, cursor, table_name, data):
+        self._mark_written(table_name)
+        columns = list(data.keys())
+        values = list(data.values())
+        placeholders = ", ".join(["?"] * len(columns))
+        
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+        self._run_statement(cursor, query, values)
+        return {
+            "status": "success", 
+            "message": f"Data inserted into '{table_name}' successfully",
+            "last_row_id": cursor.lastrowid
+        }
+
+    def _insert_many(self, cursor, table_name, columns, rows):
+        self._mark_written(table_name)
+        placeholders = ", ".join(["?"] * len(columns))
+        
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+        self._run_statement(cursor, query, rows, many=True)
+        return {
+            "status": "success",
+            "message": f"{cursor.rowcount} row(s) inserted into '{table_name}'",
+            "inserted": cursor.rowcount
+        }
+
+    def _upsert(self, cursor, table_name, rows, conflict, update=None, where=None, params=None):
+        """Insert rows, updating the existing row when a conflict target matches
+        
+        ``update`` lists the columns copied from the new row, or maps columns
+        to SQL expressions (e.g. {"quantity": "quantity + excluded.quantity"});
+        it defaults to every non-conflict column, and an empty list or dict
+        leaves existing rows untouched. Returns the resulting rows, reading
+        back any row the upsert did not change.
+        """
+        columns = list(rows[0].keys())
+        if not conflict or not all(col in columns for col in conflict):
+            raise ValueError("Conflict columns are required and must be present in every row")
+        if any(set(row.keys()) != set(columns) for row in rows):
+            raise ValueError("All rows in an upsert must have the same columns")
+        if update is None:
+            update = [col for col in columns if col not in conflict]
+        assignments = update if isinstance(update, dict) else {col: f"excluded.{col}" for col in update}
+        if not all(IDENTIFIER_RE.match(col) for col in [table_name, *columns, *conflict, *assignments]):
+            raise ValueError("Table and column names must be plain identifiers")
+        
+        self._mark_written(table_name)
+        query = (f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))}) "
+                 f"ON CONFLICT ({', '.join(conflict)}) ")
+        if assignments:
+            query += "DO UPDATE SET " + ", ".join(f"{col} = {expr}" for col, expr in assignments.items())
+            if where:
+                query += f" WHERE {where}"
+        else:
+            query += "DO NOTHING"
+        query += " RETURNING *"
+        lookup = f"SELECT * FROM {table_name} WHERE " + " AND ".join(f"{col} = ?" for col in conflict)
+        
+        results = []
+        for row in rows:
+            returned = self._run_statement(cursor, query, [row[col] for col in columns] + list(params or []),
+                                           fetch=True)
+            if not returned:
+                returned = self._run_statement(cursor, lookup, [row[col] for col in conflict], fetch=True)
+            results.extend(dict(r) for r in returned)
+        return {
+            "status": "success",
+            "message": f"{len(rows)} row(s) upserted into '{table_name}'",
+            "data": results
+        }
+
+    def build_select_query(self, table_name, columns="*", condition=None, order_by=None, limit=None):
+        query = f"SELECT {columns} FROM {table_name}"
+        
+        if condition:
+            query += f" WHERE {condition}"
+        if order_by:
+            query += " ORDER BY " + ", ".join(f"{col} {direction}" for col, direction in parse_order_by(order_by))
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return query
+
+    def _select(self, cursor, table_name, columns="*", condition=None, params=None, row_format="objects"):
+        query = self.build_select_query(table_name, columns, condition)
+        rows = self._run_statement(cursor, query, params, fetch=True)
+        
+        result = {
+            "status": "success", 
+            "message": f"Retrieved {len(rows)} rows from '{table_name}'"
+        }
+        result.update(format_rows(cursor.description, rows, row_format))
+        return result
+
+    def _update(self, cursor, table_name, data, condition, params=None):
+        self._mark_written(table_name)
+        set_clause = ", ".join([f"{col} = ?" for col in data.keys()])
+        query = f"UPDATE {table_name} SET {set_clause} WHERE {condition}"
+        
+        # Combine data values and condition parameters
+        all_params = list(data.values())
+        if params:
+            all_params.extend(params)
+        
+        self._run_statement(cursor, query, all_params)
+        rows_affected = cursor.rowcount
+        return {
+            "status": "success", 
+            "message": f"{rows_affected} row(s) updated in '{table_name}'",
+            "rows_affected": rows_affected
+        }
+
+    def _adjust(self, cursor, table_name, changes, condition, params=None, returning=None, required=False):
+        """Apply column arithmetic in one UPDATE and return the new values
+        
+        ``changes`` maps columns to {"op": value} with an op from
+        ADJUST_OPERATORS and a numeric operand, or to a plain value to
+        assign it. Guards such as
+        "stock_quantity >= ?" belong in ``condition``. With ``required`` set,
+        matching no row raises ValueError so a surrounding batch rolls back.
+        """
+        returning = returning or ["*"]
+        if not changes:
+            raise ValueError("At least one column change is required")
+        if not all(IDENTIFIER_RE.match(col) for col in [table_name, *changes]) or \
+                not all(col == "*" or IDENTIFIER_RE.match(col) for col in returning):
+            raise ValueError("Table and column names must be plain identifiers")
+        
+        assignments = []
+        values = []
+        for col, change in changes.items():
+            if isinstance(change, dict):
+                if len(change) != 1:
+                    raise ValueError(f"Change for '{col}' must have exactly one operation")
+                op, value = next(iter(change.items()))
+            else:
+                op, value = '=', change
+            if op not in ADJUST_OPERATORS:
+                raise ValueError(f"Unsupported operation '{op}' for '{col}'")
+            if op != '=' and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"Operand of '{op}' for '{col}' must be a number")
+            expr = ADJUST_OPERATORS[op].format(col=col)
+            assignments.append(f"{col} = {expr}")
+            values.extend([value] * expr.count('?'))
+        
+        self._mark_written(table_name)
+        query = f"UPDATE {table_name} SET {', '.join(assignments)} WHERE {condition} RETURNING {', '.join(returning)}"
+        rows = self._run_statement(cursor, query, values + list(params or []), fetch=True)
+        if required and not rows:
+            raise ValueError(f"No row in '{table_name}' matched {condition}")
+        return {
+            "status": "success",
+            "message": f"{len(rows)} row(s) updated in '{table_name}'",
+            "rows_affected": len(rows),
+            "data": [dict(row) for row in rows]
+        }
+
+    def _delete(self, cursor, table_name, condition=None, params=None):
+        self._mark_written(table_name)
+        query = f"DELETE FROM {table_name}"
+        
+        if condition:
+            query += f" WHERE {condition}"
+        
+        self._run_statement(cursor, query, params)
+        rows_affected = cursor.rowcount
+        return {
+            "status": "success", 
+            "message": f"{rows_affected} row(s) deleted from '{table_name}'",
+            "rows_affected": rows_affected
+        }
+    
+    def execute_query(self, query, params=None, row_format="objects"):
+        """Execute a query and return results if any"""
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            if query.strip().upper().startswith("SELECT"):
+                return self._cached_read(query, params, row_format,
+                                         lambda conn: self._execute(conn.cursor(), query, params, row_format))
+            
+            return self._write(lambda cursor: self._execute(cursor, query, params, row_format))
+        except StatementInterrupted as e:
+            logger.warning(f"{e} on {self.db_name}: {query}")
+            return {"status": "error", "message": str(e), "reason": e.reason}
+        except sqlite3.Error as e:
+            error_msg = f"Error executing query: {e}"
+            logger.error(error_msg)
             return {"status": "error", "message": error_msg}
     
-    def select_data(self, table_name, columns="*", condition=None, params=None):
-        """Select data from a table
+    def create_table(self, table_name, columns):
+        """Create a new table with specified columns
         
         Args:
-            table_name (str): Name of the target table
-            columns (str): Columns to select, default is "*" (all)
-            condition (str, optional): WHERE condition
-            params (tuple, optional): Parameters for the condition
+            table_name (str): Name of the table to create
+            columns (dict): Dictionary of column names and their data types/constraints
+                Example: {"id": "INTEGER PRIMARY KEY", "name": "TEXT NOT NULL"}
         """
         if not self.connected:
             return {"status": "error", "message": "Not connected to database. Connect first."}
         
         try:
-            query = f"SELECT {columns} FROM {table_name}"
-            
-            if condition:
-                query += f" WHERE {condition}"
-            
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            
-            results = self.cursor.fetchall()
-            
-            # Format results as a list of dictionaries
-            formatted_results = []
-            for row in results:
-                formatted_results.append(dict(row))
+            # Construct the CREATE TABLE query
+            col_defs = [f"{col_name} {col_def}" for col_name, col_def in columns.items()]
+            col_defs_str = ", ".join(col_defs)
+            query = f"CREATE TABLE IF NOT EXISTS {table_name} ({col_defs_str})"
             
-            return {
-                "status": "success", 
-                "message": f"Retrieved {len(formatted_results)} rows from '{table_name}'",
-                "data": formatted_results
-            }
+            # Execute the query
+            with self.pool.connection() as conn:
+                self._run_statement(conn.cursor(), query)
+                self._mark_written(QueryCache.EPOCH)
+                self._commit(conn)
+            logger.info(f"Table '{table_name}' created successfully")
+            return {"status": "success", "message": f"Table '{table_name}' created successfully"}
         except sqlite3.Error as e:
-            error_msg = f"Error selecting data: {e}"
+            error_msg = f"Error creating table: {e}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
     
-    def update_data(self, table_name, data, condition, params=None):
-        """Update data in a table
+    def insert_data(self, table_name, data):
+        """Insert data into a table
         
         Args:
             table_name (str): Name of the target table
-            data (dict): Dictionary of columns and values to update
-            condition (str): WHERE condition
-            params (tuple, optional): Parameters for the condition
+            data (dict): Dictionary of column names and values to insert
         """
         if not self.connected:
             return {"status": "error", "message": "Not connected to database. Connect first."}
         
         try:
-            set_clause = ", ".join([f"{col} = ?" for col in data.keys()])
-            query = f"UPDATE {table_name} SET {set_clause} WHERE {condition}"
-            
-            # Combine data values and condition parameters
-            all_params = list(data.values())
-            if params:
-                all_params.extend(params)
-            
-            self.cursor.execute(query, all_params)
-            self.conn.commit()
-            rows_affected = self.cursor.rowcount
-            logger.info(f"{rows_affected} row(s) updated in '{table_name}'")
-            return {
-                "status": "success", 
-                "message": f"{rows_affected} row(s) updated in '{table_name}'",
-                "rows_affected": rows_affected
-            }
+            result = self._write(lambda cursor: self._insert(cursor, table_name, data))
+            logger.info(f"Data inserted into '{table_name}' successfully")
+            return result
         except sqlite3.Error as e:
-            error_msg = f"Error updating data: {e}"
+            error_msg = f"Error inserting data: {e}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
     
-    def delete_data(self, table_name, condition=None, params=None):
-        """Delete data from a table
+    def insert_many(self, table_name, columns, rows):
+        """Insert many rows into a table with a single executemany and commit
         
         Args:
             table_name (str): Name of the target table
-            condition (str, optional): WHERE condition
-            params (tuple, optional): Parameters for the condition
+            columns (list): Column names, in the order values appear in each row
+            rows (list): List of value lists, one per row
         """
         if not self.connected:
             return {"status": "error", "message": "Not connected to database. Connect first."}
         
         try:
-            query = f"DELETE FROM {table_name}"
-            
-            if condition:
-                query += f" WHERE {condition}"
-            
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            
-            self.conn.commit()
-            rows_affected = self.cursor.rowcount
-            logger.info(f"{rows_affected} row(s) deleted from '{table_name}'")
-            return {
-                "status": "success", 
-                "message": f"{rows_affected} row(s) deleted from '{table_name}'",
-                "rows_affected": rows_affected
-            }
+            result = self._write(lambda cursor: self._insert_many(cursor, table_name, columns, rows))
+            logger.info(f"{result['inserted']} row(s) inserted into '{table_name}'")
+            return result
         except sqlite3.Error as e:
-            error_msg = f"Error deleting data: {e}"
+            error_msg = f"Error inserting data: {e}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
     
-    def get_table_schema(self, table_name):
-        """Get the schema information for a specific table"""
+    def select_data(self, table_name, columns="*", condition=None, params=None, row_format="objects"):
+        """Select data from a table
+        
+        Args:
+            table_name (str): Name of the target table
+            columns (str): Columns to select, default is "*" (all)
+            condition (str, optional): WHERE condition
+            params (tuple, optional): Parameters for the condition
+            row_format (str, optional): Result layout, one of ROW_FORMATS
+        """
         if not self.connected:
             return {"status": "error", "message": "Not connected to database. Connect first."}
         
         try:
-            self.cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = self.cursor.fetchall()
-            
-            # Format columns as a list of dictionaries
-            formatted_columns = []
-            for col in columns:
-                formatted_columns.append({
-                    "cid": col[0],
-                    "name": col[1],
-                    "type": col[2],
-                    "notnull": col[3],
-                    "default_value": col[4],
-                    "pk": col[5]
-                })
-            
-            return {
-                "status": "success", 
-                "message": f"Retrieved schema for '{table_name}'",
-                "schema": formatted_columns
-            }
+            query = self.build_select_query(table_name, columns, condition)
+            return self._cached_read(
+                query, params, row_format,
+                lambda conn: self._select(conn.cursor(), table_name, columns, condition, params, row_format)
+            )
         except sqlite3.Error as e:
-            error_msg = f"Error getting table schema: {e}"
+            error_msg = f"Error selecting data: {e}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
     
-    def list_tables(self):
-        """List all tables in the database"""
+    def multi_get(self, table_name, key, ids, columns=None, group=False):
+        """Fetch the rows for a list of key values with chunked IN queries
+        
+        Args:
+            table_name (str): Name of the target table
+            key (str): Column the ids are matched against
+            ids (list): Key values; duplicates are looked up once
+            columns (list, optional): Columns to return; the key column is always included
+            group (bool, optional): Return a list of rows per key, for keys
+                that are not unique (e.g. order_items by order_id)
+        
+        Results are keyed by the string form of each key value, since JSON
+        object keys are strings; ids with no row are listed in "missing".
+        """
         if not self.connected:
             return {"status": "error", "message": "Not connected to database. Connect first."}
         
+        columns = list(columns or [])
+        if not all(IDENTIFIER_RE.match(col) for col in [table_name, key, *columns]):
+            return {"status": "error", "message": "Table and column names must be plain identifiers"}
+        if columns and key not in columns:
+            columns.insert(0, key)
+        select_columns = ", ".join(columns) if columns else "*"
+        
+        unique_ids = list(dict.fromkeys(ids))
+        data = {}
         try:
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = self.cursor.fetchall()
-            table_list = [table[0] for table in tables]
-            
-            return {
-                "status": "success", 
-                "message": f"Found {len(table_list)} tables",
-                "tables": table_list
-            }
+            for start in range(0, len(unique_ids), MULTI_GET_CHUNK_SIZE):
+                chunk = unique_ids[start:start + MULTI_GET_CHUNK_SIZE]
+                condition = f"{key} IN ({', '.join(['?'] * len(chunk))})"
+                query = self.build_select_query(table_name, select_columns, condition)
+                result = self._cached_read(
+                    query, chunk, "objects",
+                    lambda conn: self._select(conn.cursor(), table_name, select_columns, condition, chunk)
+                )
+                for row in result["data"]:
+                    if group:
+                        data.setdefault(str(row[key]), []).append(row)
+                    else:
+                        data[str(row[key])] = row
         except sqlite3.Error as e:
-            error_msg = f"Error listing tables: {e}"
+            error_msg = f"Error selecting data: {e}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
+        
+        return {
+            "status": "success",
+            "message": f"Found {len(data)} of {len(unique_ids)} keys in '{table_name}'",
+            "data": data,
+            "missing": [value for value in unique_ids if str(value) not in data]
+        }
     
-    def drop_table(self, table_name):
-        """Drop a table from the database"""
+    def select_nested(self, table_name, columns=None, condition=None, params=None,
+                      order_by=None, limit=None, children=None):
+        """Fetch parent rows with their child collections nested inside them
+        
+        Args:
+            table_name (str): Parent table
+            columns (list, optional): Parent columns to return, default all
+            condition (str, optional): WHERE condition on the parent table
+            params (list, optional): Parameters for the condition
+            order_by (str, optional): Parent sort, e.g. "created_at DESC"
+            limit (int, optional): Maximum number of parent rows
+            children (dict): Collection name -> relation spec with
+                "table" (child table), "foreign_key" (column referencing the
+                parent), optional "parent_key" (parent column, defaults to
+                foreign_key), "columns" and "order_by". For many-to-many
+                relations, "through": {"table": junction, "key": column}
+                joins the child to a junction table holding foreign_key.
+                Example: {"items": {"table": "order_items", "foreign_key": "order_id"}}
+        
+        Each collection is loaded with one IN (...) query per chunk of parent
+        keys, all inside one read transaction, so the document is consistent
+        and costs 1 + len(children) statements rather than one per parent.
+        """
         if not self.connected:
             return {"status": "error", "message": "Not connected to database. Connect first."}
         
         try:
-            self.cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-            self.conn.commit()
-            logger.info(f"Table '{table_name}' dropped successfully")
-            return {"status": "success", "message": f"Table '{table_name}' dropped successfully"}
+            relations = [nested_relation(name, spec) for name, spec in (children or {}).items()]
+            columns = list(columns or [])
+            if not all(IDENTIFIER_RE.match(col) for col in [table_name, *columns]):
+                raise ValueError("Table and column names must be plain identifiers")
+            for relation in relations:
+                if columns and relation["parent_key"] not in columns:
+                    columns.append(relation["parent_key"])
+            
+            query = f"SELECT {', '.join(columns) if columns else '*'} FROM {table_name}"
+            if condition:
+                query += f" WHERE {condition}"
+            if order_by:
+                query += " ORDER BY " + ", ".join(f"{col} {direction}" for col, direction in parse_order_by(order_by))
+            if limit is not None:
+                query += f" LIMIT {int(limit)}"
+            
+            with self._reader().connection() as conn:
+                cursor = conn.cursor()
+                # One read transaction: parents and children see the same snapshot
+                cursor.execute("BEGIN")
+                parents = [dict(row) for row in self._run_statement(cursor, query, params, fetch=True)]
+                parent_columns = [col[0] for col in cursor.description]
+                
+                for relation in relations:
+                    if relation["parent_key"] not in parent_columns:
+                        raise ValueError(f"'{table_name}' has no column '{relation['parent_key']}' for "
+                                         f"'{relation['name']}'; set parent_key")
+                    by_key = {}
+                    for parent in parents:
+                        parent[relation["name"]] = by_key.setdefault(parent[relation["parent_key"]], [])
+                    keys = [key for key in by_key if key is not None]
+                    for start in range(0, len(keys), MULTI_GET_CHUNK_SIZE):
+                        chunk = keys[start:start + MULTI_GET_CHUNK_SIZE]
+                        child_query = relation["query"].format(placeholders=", ".join(["?"] * len(chunk)))
+                        for row in self._run_statement(cursor, child_query, chunk, fetch=True):
+                            child = dict(row)
+                            siblings = by_key.get(child.pop("_parent_key"))
+                            if siblings is not None:
+                                siblings.append(child)
+        except ValueError as e:
+            return {"status": "error", "message": f"Invalid nested query: {e}"}
         except sqlite3.Error as e:
-            error_msg = f"Error dropping table: {e}"
+            error_msg = f"Error selecting data: {e}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
+        
+        return {
+            "status": "success",
+            "message": f"Retrieved {len(parents)} rows from '{table_name}'",
+            "data": parents
+        }
     
-    def backup_database(self, backup_dir="backups"):
-        """Create a backup of the database"""
+    def select_page(self, table_name, columns="*", condition=None, params=None,
+                    order_by=None, limit=None, after=None, row_format="objects"):
+        """Select one page of rows using keyset pagination
+        
+        Args:
+            table_name (str): Name of the target table
+            columns (str): Columns to select, default is "*" (all)
+            condition (str, optional): WHERE condition
+            params (tuple, optional): Parameters for the condition
+            order_by (str, optional): Comma-separated sort columns, each
+                optionally followed by ASC or DESC; they may be NULL. rowid
+                (the primary key of a WITHOUT ROWID table) is always appended
+                as a tiebreaker so every row has a unique position. Views
+                have no such key and are rejected.
+            limit (int, optional): Maximum number of rows to return
+            after (str, optional): Opaque cursor returned as next_cursor by
+                the previous page
+            row_format (str, optional): Result layout, one of ROW_FORMATS
+        
+        Each page seeks directly past the previous page's last key instead of
+        using OFFSET, so deep pages cost the same as the first one.
+        """
         if not self.connected:
             return {"status": "error", "message": "Not connected to database. Connect first."}
         
         try:
-            # Create backup directory if it doesn't exist
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir)
+            keys = parse_order_by(order_by) if order_by else []
+            with self.read_pool.connection() as conn:
+                unique_key = self._row_key_columns(conn, table_name)
+            keys.extend((col, "ASC") for col in unique_key if (col, "ASC") not in keys and (col, "DESC") not in keys)
+            key_columns = [f"{col} AS _keyset_{i}" for i, (col, _) in enumerate(keys)]
+            query = f"SELECT {columns}, {', '.join(key_columns)} FROM {table_name}"
             
-            # Generate backup filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f"{backup_dir}/{os.path.splitext(self.db_name)[0]}_{timestamp}.sqlite"
+            clauses = [f"({condition})"] if condition else []
+            all_params = list(params) if params else []
+            if after:
+                values = decode_cursor(after)
+                if len(values) != len(keys):
+                    raise ValueError("Cursor does not match the requested order_by")
+                seek_sql, seek_params = keyset_predicate(keys, values)
+                clauses.append(seek_sql)
+                all_params.extend(seek_params)
             
-            # Create backup connection
-            backup_conn = sqlite3.connect(backup_filename)
+            if clauses:
+                query += " WHERE " + " AND ".join(clauses)
+            query += " ORDER BY " + ", ".join(f"{col} {direction}" for col, direction in keys)
+            if limit is not None:
+                # Fetch one extra row to learn whether another page exists
+                query += f" LIMIT {int(limit) + 1}"
             
-            # Copy database content
-            self.conn.backup(backup_conn)
-            backup_conn.close()
+            def run(conn):
+                cursor = conn.cursor()
+                rows = self._run_statement(cursor, query, all_params, fetch=True)
+                
+                has_more = limit is not None and len(rows) > int(limit)
+                if has_more:
+                    rows = rows[:int(limit)]
+                
+                # The keyset columns come last; split them off every row
+                width = len(cursor.description) - len(keys)
+                last_key = list(rows[-1])[width:] if rows else None
+                rows = [tuple(row)[:width] for row in rows]
+                
+                result = {
+                    "status": "success", 
+                    "message": f"Retrieved {len(rows)} rows from '{table_name}'",
+                    "next_cursor": encode_cursor(last_key) if has_more and last_key is not None else None
+                }
+                result.update(format_rows(cursor.description[:width], rows, row_format))
+                return result
             
-            logger.info(f"Database backup created at {backup_filename}")
-            return {
-                "status": "success", 
-                "message": f"Database backup created successfully",
-                "backup_file": backup_filename
-            }
+            return self._cached_read(query, all_params, row_format, run)
+        except ValueError as e:
+            return {"status": "error", "message": f"Invalid pagination parameters: {e}"}
         except sqlite3.Error as e:
-            error_msg = f"Error backing up database: {e}"
+            error_msg = f"Error selecting data: {e}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
     
+    def _row_key_columns(self, conn, table_name):
+        """Columns that identify a row of table_name: rowid, or the primary
+        key of a WITHOUT ROWID table. Raises ValueError for views."""
+        row = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE type IN ('table', 'view') AND name = ? COLLATE NOCASE",
+            (table_name,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"No table named '{table_name}'")
+        if row['type'] == 'view':
+            raise ValueError(f"'{table_name}' is a view, which has no unique row key to page by")
+        if not WITHOUT_ROWID_RE.search(row['sql'] or ''):
+            return ["rowid"]
+        columns = conn.execute(f"PRAGMA table_info({quote_identifier(row['name'])})").fetchall()
+        return [col['name'] for col in sorted(columns, key=lambda col: col['pk']) if col['pk'] > 0]
     
+    def iter_query(self, query, params=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Execute a SELECT and yield its rows without materializing the result
+        
+        The first item yielded is the list of column names, produced as soon
+        as the statement has executed so callers can surface errors before
+        they start streaming. Rows follow as dictionaries, fetched from the
+        cursor ``chunk_size`` at a time. The pooled connection is held until
+        the generator is exhausted or closed.
+        """
+        if not self.connected:
+            raise sqlite3.ProgrammingError("Not connected to database. Connect first.")
+        
+        with self._reader().connection() as conn, self._time_budget(conn, query):
+            cursor = conn.cursor()
+            start = time.perf_counter()
+            try:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+            except sqlite3.Error:
+                self._record_statement(cursor, query, params, start, 0, error=True)
+                raise
+            
+            yield [col[0] for col in cursor.description or []]
+            streamed = 0
+            error = False
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    streamed += len(rows)
+                    for row in rows:
+                        yield dict(row)
+            except sqlite3.Error:
+                error = True
+                raise
+            finally:
+                self._record_statement(cursor, query, params, start, streamed, error=error)
+    
+    def upsert_data(self, table_name, data, conflict, update=None, where=None, params=None):
+        """Insert or update rows in one statement per row, returning the resulting rows
+        
+        Args:
+            table_name (str): Name of the target table
+            data (dict|list): One row dict, or a list of row dicts with the same columns
+            conflict (list): Columns of the PRIMARY KEY or UNIQUE constraint to match on
+            update (list|dict, optional): Columns to overwrite, or column -> SQL expression
+                Example: {"quantity": "quantity + excluded.quantity"}
+            where (str, optional): Guard on DO UPDATE; rows failing it are returned unchanged
+            params (list, optional): Parameters for placeholders in update expressions and where
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        rows = data if isinstance(data, list) else [data]
+        if not rows or not all(isinstance(row, dict) and row for row in rows):
+            return {"status": "error", "message": "Upsert requires a row object or a non-empty list of row objects"}
+        
+        try:
+            result = self._write(lambda cursor: self._upsert(cursor, table_name, rows, conflict, update, where, params))
+            if not isinstance(data, list):
+                result["data"] = result["data"][0] if result["data"] else None
+            logger.info(f"{len(rows)} row(s) upserted into '{table_name}'")
+            return result
+        except (sqlite3.Error, ValueError) as e:
+            error_msg = f"Error upserting data: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def update_data(self, table_name, data, condition, params=None):
+        """Update data in a table
+        
+        Args:
+            table_name (str): Name of the target table
+            data (dict): Dictionary of columns and values to update
+            condition (str): WHERE condition
+            params (tuple, optional): Parameters for the condition
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            result = self._write(lambda cursor: self._update(cursor, table_name, data, condition, params))
+            logger.info(f"{result['rows_affected']} row(s) updated in '{table_name}'")
+            return result
+        except sqlite3.Error as e:
+            error_msg = f"Error updating data: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def adjust_data(self, table_name, changes, condition, params=None, returning=None):
+        """Atomically apply column arithmetic and return the updated rows
+        
+        Args:
+            table_name (str): Name of the target table
+            changes (dict): Column -> {"+=" | "-=" | "max" | "min" | "=": value}, or a plain value
+                Example: {"stock_quantity": {"-=": 2}, "updated_at": "2024-01-01 00:00:00"}
+            condition (str): WHERE condition, including any guard such as "stock_quantity >= ?"
+            params (list, optional): Parameters for the condition
+            returning (list, optional): Columns to return for each updated row, default all
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            result = self._write(lambda cursor: self._adjust(cursor, table_name, changes, condition,
+                                                             params, returning))
+            logger.info(f"{result['rows_affected']} row(s) adjusted in '{table_name}'")
+            return result
+        except (sqlite3.Error, ValueError) as e:
+            error_msg = f"Error updating data: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def delete_data(self, table_name, condition=None, params=None):
+        """Delete data from a table
+        
+        Args:
+            table_name (str): Name of the target table
+            condition (str, optional): WHERE condition
+            params (tuple, optional): Parameters for the condition
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            result = self._write(lambda cursor: self._delete(cursor, table_name, condition, params))
+            logger.info(f"{result['rows_affected']} row(s) deleted from '{table_name}'")
+            return result
+        except sqlite3.Error as e:
+            error_msg = f"Error deleting data: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+
+    def run_batch(self, operations):
+        """Run an ordered list of operations in a single transaction
+        
+        Args:
+            operations (list): Operation dicts, each with an "op" of insert,
+                insert_many, upsert, update, adjust, delete, select or execute plus that
+                operation's arguments
+                Example: {"op": "update", "table": "cart_items", "values": {...},
+                          "condition": "item_id = ?", "params": ["..."]}
+        
+        Either every operation is committed or, on the first failure, none are.
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        index = 0
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                results = []
+                try:
+                    cursor.execute("BEGIN")
+                    for index, operation in enumerate(operations):
+                        results.append(self._run_operation(cursor, operation))
+                    self._commit(conn)
+                except (sqlite3.Error, ValueError, KeyError, TypeError):
+                    conn.rollback()
+                    self._writes.tables = None
+                    raise
+            logger.info(f"Batch of {len(results)} operation(s) committed")
+            return {
+                "status": "success",
+                "message": f"Batch of {len(results)} operation(s) executed successfully",
+                "results": results
+            }
+        except (sqlite3.Error, ValueError, KeyError, TypeError) as e:
+            error_msg = f"Error executing batch operation {index}: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg, "failed_index": index}
+
+    def _run_operation(self, cursor, operation):
+        op = operation.get('op')
+        if op == 'insert':
+            return self._insert(cursor, operation['table'], operation['data'])
+        if op == 'insert_many':
+            return self._insert_many(cursor, operation['table'], operation['columns'], operation['rows'])
+        if op == 'upsert':
+            rows = operation['data']
+            return self._upsert(cursor, operation['table'], rows if isinstance(rows, list) else [rows],
+                                operation['conflict'], operation.get('update'), operation.get('where'),
+                                operation.get('params'))
+        if op == 'update':
+            return self._update(cursor, operation['table'], operation['values'],
+                                operation['condition'], operation.get('params'))
+        if op == 'adjust':
+            return self._adjust(cursor, operation['table'], operation['changes'], operation['condition'],
+                                operation.get('params'), operation.get('returning'),
+                                operation.get('required', False))
+        if op == 'delete':
+            return self._delete(cursor, operation['table'], operation.get('condition'),
+                                operation.get('params'))
+        if op == 'select':
+            return self._select(cursor, operation['table'], operation.get('columns', '*'),
+                                operation.get('condition'), operation.get('params'),
+                                operation.get('format', 'objects'))
+        if op == 'execute':
+            return self._execute(cursor, operation['query'], operation.get('params'),
+                                 operation.get('format', 'objects'))
+        raise ValueError(f"Unsupported operation '{op}'")
+    
+    def get_table_schema(self, table_name):
+        """Get the schema information for a specific table"""
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            with self.read_pool.connection() as conn:
+                columns = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+            
+            # Format columns as a list of dictionaries
+            formatted_columns = []
+            for col in columns:
+                formatted_columns.append({
+                    "cid": col[0],
+                    "name": col[1],
+                    "type": col[2],
+                    "notnull": col[3],
+                    "default_value": col[4],
+                    "pk": col[5]
+                })
+            
+            return {
+                "status": "success", 
+                "message": f"Retrieved schema for '{table_name}'",
+                "schema": formatted_columns
+            }
+        except sqlite3.Error as e:
+            error_msg = f"Error getting table schema: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def list_tables(self):
+        """List all tables in the database"""
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            with self.read_pool.connection() as conn:
+                tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+            table_list = [table[0] for table in tables if table[0] not in INTERNAL_TABLES]
+            
+            return {
+                "status": "success", 
+                "message": f"Found {len(table_list)} tables",
+                "tables": table_list
+            }
+        except sqlite3.Error as e:
+            error_msg = f"Error listing tables: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def count_rows(self, table_name, condition=None, params=None, exact=False):
+        """Count the rows of a table
+        
+        Unfiltered counts are read from the table's row counter, a single
+        key lookup. A condition, ``exact``, or a table without a counter
+        (row counters disabled or not installed yet) runs COUNT(*) instead.
+        Either result goes through the query cache.
+        
+        Args:
+            table_name (str): Name of the counted table
+            condition (str, optional): WHERE condition
+            params (tuple, optional): Parameters for the condition
+            exact (bool, optional): Always scan, e.g. to check a counter
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        def count(query, query_params, source):
+            def run(conn):
+                rows = self._run_statement(conn.cursor(), query, query_params, fetch=True)
+                if not rows:
+                    return {"status": "error", "message": f"No row counter for '{table_name}'"}
+                return {
+                    "status": "success",
+                    "message": f"Counted rows in '{table_name}'",
+                    "count": rows[0][0],
+                    "source": source
+                }
+            return self._cached_read(query, query_params, "count", run)
+        
+        try:
+            if self.row_counters and not condition and not exact:
+                try:
+                    result = count(f"SELECT row_count FROM {ROW_COUNT_TABLE} WHERE table_name = ?",
+                                   (table_name,), "counter")
+                    if result["status"] == "success":
+                        return result
+                except sqlite3.OperationalError:
+                    pass  # a snapshot taken before the counters existed
+            
+            query = f"SELECT count(*) FROM {quote_identifier(table_name)}"
+            if condition:
+                query += f" WHERE {condition}"
+            return count(query, params, "scan")
+        except sqlite3.Error as e:
+            error_msg = f"Error counting rows: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def table_stats(self, table_name=None):
+        """Row counts and on-disk size of each table, or of one table
+        
+        Rows come from the row counters where they exist. Page counts and
+        sizes come from dbstat and include the table's indexes; dbstat reads
+        every page of the file, so this is an admin call rather than one for
+        request paths. If SQLite was built without dbstat only the row counts
+        and database totals are returned. The change log and row counter
+        tables are reported under "internal" rather than "tables".
+        
+        Args:
+            table_name (str, optional): Limit the report to this table
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            with self.read_pool.connection() as conn:
+                objects = conn.execute("SELECT type, name, tbl_name FROM sqlite_master").fetchall()
+                tables = {row[1]: {"name": row[1], "rows": None, "pages": 0, "size_bytes": 0,
+                                   "index_pages": 0, "index_size_bytes": 0, "unused_bytes": 0}
+                          for row in objects if row[0] == 'table' and table_name in (None, row[1])}
+                if table_name is not None and not tables:
+                    return {"status": "error", "message": f"Table '{table_name}' does not exist"}
+                owner = {row[1]: row[2] for row in objects if row[2] in tables}
+                
+                if any(row[1] == ROW_COUNT_TABLE for row in objects):
+                    counters = conn.execute(
+                        f"SELECT table_name, row_count FROM {ROW_COUNT_TABLE} "
+                        f"WHERE table_name IN ({', '.join('?' for _ in tables)})", list(tables)
+                    )
+                    for name, count in counters:
+                        tables[name]["rows"] = count
+                for name, stats in tables.items():
+                    if stats["rows"] is None:
+                        query = f"SELECT count(*) FROM {quote_identifier(name)}"
+                        stats["rows"] = self._run_statement(conn.cursor(), query, fetch=True)[0][0]
+                
+                try:
+                    pages = self._run_statement(
+                        conn.cursor(), "SELECT name, pageno, pgsize, unused FROM dbstat WHERE aggregate = 1", fetch=True
+                    )
+                    dbstat = True
+                except sqlite3.OperationalError as e:
+                    if 'dbstat' not in str(e):
+                        raise
+                    pages, dbstat = [], False
+                    for stats in tables.values():
+                        stats.update(pages=None, size_bytes=None, index_pages=None,
+                                     index_size_bytes=None, unused_bytes=None)
+                for name, page_count, size, unused in pages:
+                    if name not in owner:
+                        continue
+                    stats = tables[owner[name]]
+                    prefix = "" if name == owner[name] else "index_"
+                    stats[prefix + "pages"] += page_count
+                    stats[prefix + "size_bytes"] += size
+                    stats["unused_bytes"] += unused
+                
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            
+            table_list = sorted(tables.values(), key=lambda stats: (-(stats["size_bytes"] or 0), stats["name"]))
+            internal = [stats for stats in table_list if stats["name"] in INTERNAL_TABLES]
+            table_list = [stats for stats in table_list if stats["name"] not in INTERNAL_TABLES]
+            return {
+                "status": "success",
+                "message": f"Retrieved stats for {len(table_list)} tables",
+                "dbstat": dbstat,
+                "page_size": page_size,
+                "page_count": page_count,
+                "freelist_count": free_pages,
+                "size_bytes": page_size * page_count,
+                "tables": table_list,
+                "internal": internal
+            }
+        except sqlite3.Error as e:
+            error_msg = f"Error getting table stats: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def drop_table(self, table_name):
+        """Drop a table from the database"""
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            with self.pool.connection() as conn:
+                self._run_statement(conn.cursor(), f"DROP TABLE IF EXISTS {table_name}")
+                self._mark_written(QueryCache.EPOCH)
+                self._commit(conn)
+            logger.info(f"Table '{table_name}' dropped successfully")
+            return {"status": "success", "message": f"Table '{table_name}' dropped successfully"}
+        except sqlite3.Error as e:
+            error_msg = f"Error dropping table: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def list_indexes(self, table_name):
+        """List the indexes on a table with their columns"""
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            with self.read_pool.connection() as conn:
+                indexes = []
+                for index in conn.execute(f"PRAGMA index_list({table_name})").fetchall():
+                    columns = conn.execute(f"PRAGMA index_info({index['name']})").fetchall()
+                    indexes.append({
+                        "name": index['name'],
+                        "unique": bool(index['unique']),
+                        "origin": index['origin'],
+                        "partial": bool(index['partial']),
+                        "columns": [col['name'] for col in columns]
+                    })
+            
+            return {
+                "status": "success",
+                "message": f"Found {len(indexes)} indexes on '{table_name}'",
+                "indexes": indexes
+            }
+        except sqlite3.Error as e:
+            error_msg = f"Error listing indexes: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+
+    def create_index(self, table_name, columns, unique=False, index_name=None):
+        """Create an index on one or more columns of a table
+        
+        Args:
+            table_name (str): Name of the indexed table
+            columns (list): Column names, most selective equality columns first
+            unique (bool, optional): Create a UNIQUE index
+            index_name (str, optional): Defaults to idx_<table>_<col1>_<col2>...
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        if not columns or not all(IDENTIFIER_RE.match(col) for col in [table_name] + list(columns)):
+            return {"status": "error", "message": "Table and column names must be plain identifiers"}
+        index_name = index_name or f"idx_{table_name}_{'_'.join(columns)}"
+        if not IDENTIFIER_RE.match(index_name):
+            return {"status": "error", "message": f"Invalid index name '{index_name}'"}
+        
+        try:
+            query = (f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} "
+                     f"ON {table_name} ({', '.join(columns)})")
+            with self.pool.connection() as conn:
+                self._run_statement(conn.cursor(), query)
+                self._mark_written(QueryCache.EPOCH)
+                self._commit(conn)
+            logger.info(f"Index '{index_name}' created on '{table_name}'")
+            return {"status": "success", "message": f"Index '{index_name}' created on '{table_name}'", "index": index_name}
+        except sqlite3.Error as e:
+            error_msg = f"Error creating index: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+
+    def drop_index(self, index_name):
+        """Drop an index by name"""
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        if not IDENTIFIER_RE.match(index_name):
+            return {"status": "error", "message": f"Invalid index name '{index_name}'"}
+        
+        try:
+            with self.pool.connection() as conn:
+                self._run_statement(conn.cursor(), f"DROP INDEX IF EXISTS {index_name}")
+                self._mark_written(QueryCache.EPOCH)
+                self._commit(conn)
+            logger.info(f"Index '{index_name}' dropped")
+            return {"status": "success", "message": f"Index '{index_name}' dropped"}
+        except sqlite3.Error as e:
+            error_msg = f"Error dropping index: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+
+    def advise_indexes(self, min_calls=5, apply=False):
+        """Recommend indexes for full table scans in frequently run statements
+        
+        Every recorded statement run at least ``min_calls`` times is re-planned
+        with EXPLAIN QUERY PLAN. For each "SCAN <table>" step, the columns of
+        that table compared in the statement (equality first, then ranges)
+        become a candidate index, unless an existing index already starts with
+        them. With ``apply`` the candidates are created.
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        try:
+            recommendations = {}
+            with self.read_pool.connection() as conn:
+                table_columns = {}
+                existing = {}
+                for stmt in self.query_stats.hot_statements(min_calls):
+                    try:
+                        plan = conn.execute(f"EXPLAIN QUERY PLAN {stmt['sql']}",
+                                            [None] * stmt['param_count']).fetchall()
+                    except sqlite3.Error:
+                        continue
+                    
+                    aliases = table_aliases(stmt['sql'])
+                    for step in plan:
+                        scan = PLAN_SCAN_RE.match(step[3])
+                        automatic = PLAN_AUTOMATIC_INDEX_RE.match(step[3])
+                        if not scan and not automatic:
+                            continue
+                        alias = (scan or automatic).group(1)
+                        table = aliases.get(alias.lower(), alias)
+                        if table not in table_columns:
+                            table_columns[table] = {row['name'].lower(): row['name'] for row in
+                                                    conn.execute(f"PRAGMA table_info({table})").fetchall()}
+                            existing[table] = [
+                                [col['name'].lower() for col in conn.execute(f"PRAGMA index_info({index['name']})")]
+                                for index in conn.execute(f"PRAGMA index_list({table})").fetchall()
+                            ]
+                        
+                        if automatic:
+                            columns = [table_columns[table].get(term.split('=')[0].strip().lower())
+                                       for term in automatic.group(2).split(' AND ')]
+                            columns = [col for col in columns if col]
+                        else:
+                            qualifiers = {name for name, target in aliases.items() if target == table}
+                            columns = indexable_columns(stmt['sql'], table_columns[table], qualifiers)
+                        if not columns:
+                            continue
+                        lowered = [col.lower() for col in columns]
+                        if any(index[:len(lowered)] == lowered for index in existing[table]):
+                            continue
+                        
+                        key = (table, tuple(columns))
+                        entry = recommendations.setdefault(key, {
+                            "table": table,
+                            "columns": columns,
+                            "create_sql": f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} "
+                                          f"ON {table} ({', '.join(columns)})",
+                            "plan_step": step[3],
+                            "statements": [],
+                            "calls": 0,
+                            "total_ms": 0.0
+                        })
+                        entry["statements"].append(stmt['fingerprint'])
+                        entry["calls"] += stmt['count']
+                        entry["total_ms"] = round(entry["total_ms"] + stmt['total_ms'], 3)
+            
+            # An index on (a, b) also serves lookups on a alone
+            for key, entry in list(recommendations.items()):
+                table, columns = key
+                wider = next((other for (other_table, other_columns), other in recommendations.items()
+                              if other_table == table and len(other_columns) > len(columns)
+                              and other_columns[:len(columns)] == columns), None)
+                if wider is not None:
+                    wider["statements"].extend(entry["statements"])
+                    wider["calls"] += entry["calls"]
+                    wider["total_ms"] = round(wider["total_ms"] + entry["total_ms"], 3)
+                    del recommendations[key]
+            
+            advice = sorted(recommendations.values(), key=lambda r: r["total_ms"], reverse=True)
+            if apply:
+                for entry in advice:
+                    entry["applied"] = self.create_index(entry["table"], entry["columns"])["status"] == "success"
+            
+            return {
+                "status": "success",
+                "message": f"{len(advice)} index recommendation(s)",
+                "recommendations": advice
+            }
+        except sqlite3.Error as e:
+            error_msg = f"Error advising indexes: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def register_query(self, name, query):
+        """Register a statement under a name so callers can run it by name
+        
+        The statement is planned once on a pooled connection, which rejects
+        invalid SQL up front and records the plan it will use. Re-registering
+        the same SQL under a name keeps its stats, so services can register
+        their queries on every startup.
+        
+        Args:
+            name (str): Name the statement is called by
+            query (str): SQL with "?" or ":name" placeholders
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        if not QUERY_NAME_RE.match(name or ''):
+            return {"status": "error", "message": f"Invalid query name: {name}"}
+        if not query or not query.strip():
+            return {"status": "error", "message": "Query is required"}
+        
+        try:
+            with self.read_pool.connection() as conn:
+                plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", placeholder_params(query)).fetchall()
+        except sqlite3.Error as e:
+            error_msg = f"Error registering query '{name}': {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+        
+        with self._named_lock:
+            entry = self.named_queries.get(name)
+            if entry is None or entry["sql"] != query:
+                entry = {
+                    "name": name,
+                    "sql": query,
+                    "read": query.strip().upper().startswith("SELECT"),
+                    "registered_at": datetime.now().isoformat(),
+                    "calls": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0
+                }
+                self.named_queries[name] = entry
+            entry["plan"] = [row[3] for row in plan]
+        
+        logger.info(f"Registered query '{name}' on {self.db_name}")
+        return {"status": "success", "message": f"Query '{name}' registered", "plan": entry["plan"]}
+    
+    def unregister_query(self, name):
+        """Forget a named query; returns False if it was not registered"""
+        with self._named_lock:
+            return self.named_queries.pop(name, None) is not None
+    
+    def get_named_query(self, name):
+        with self._named_lock:
+            return self.named_queries.get(name)
+    
+    def run_named_query(self, name, params=None, row_format="objects"):
+        """Run a registered query with the given parameters
+        
+        Args:
+            name (str): Name the query was registered under
+            params (list|dict): Positional or named bind parameters
+            row_format (str): Result layout for SELECT queries
+        """
+        entry = self.get_named_query(name)
+        if entry is None:
+            return {"status": "error", "message": f"Query '{name}' is not registered"}
+        
+        start = time.perf_counter()
+        result = self.execute_query(entry["sql"], params, row_format)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._named_lock:
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            if result.get("status") == "error":
+                entry["errors"] += 1
+        return result
+    
+    def named_query_stats(self):
+        """Return every registered query with its call statistics"""
+        with self._named_lock:
+            return [
+                {
+                    "name": entry["name"],
+                    "sql": entry["sql"],
+                    "read": entry["read"],
+                    "registered_at": entry["registered_at"],
+                    "plan": entry["plan"],
+                    "calls": entry["calls"],
+                    "errors": entry["errors"],
+                    "avg_ms": round(entry["total_ms"] / entry["calls"], 3) if entry["calls"] else 0.0,
+                    "max_ms": round(entry["max_ms"], 3)
+                }
+                for entry in sorted(self.named_queries.values(), key=lambda e: e["name"])
+            ]
+    
+    def changes_since(self, since=0, tables=None, limit=CHANGE_FEED_LIMIT, wait_s=0):
+        """Committed row changes after sequence number ``since``
+        
+        Each change has its sequence number (a version that only grows),
+        table, primary key, operation and commit time. ``next`` in the
+        result is the ``since`` for the following call. ``reset`` means
+        changes after ``since`` were already pruned from the log, so the
+        caller has to reload whatever it cached.
+        
+        Args:
+            since (int, optional): Last sequence number the caller has seen
+            tables (list, optional): Only report changes to these tables
+            limit (int, optional): Maximum number of changes returned
+            wait_s (float, optional): Long-poll for up to this long if there is nothing new
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        if not self.change_capture:
+            return {"status": "error", "message": f"Change capture is disabled for {self.db_name}"}
+        
+        deadline = time.monotonic() + min(max(wait_s, 0), CHANGE_MAX_WAIT_S)
+        query = f"SELECT seq, table_name, row_key, op, changed_at FROM {CHANGE_LOG_TABLE} WHERE seq > ? AND seq <= ?"
+        if tables:
+            query += f" AND table_name IN ({', '.join('?' for _ in tables)})"
+        query += " ORDER BY seq LIMIT ?"
+        
+        # Waiting feeds deliberately don't count as activity in busy() or
+        # last_used, so a subscriber never blocks maintenance or eviction
+        try:
+            while True:
+                with self._changes_cond:
+                    seen = self._commits
+                with self.read_pool.connection() as conn:
+                    oldest, newest = conn.execute(f"SELECT min(seq), max(seq) FROM {CHANGE_LOG_TABLE}").fetchone()
+                    newest = newest or 0
+                    reset = since > newest or (oldest is not None and since < oldest - 1)
+                    start = newest if reset else since
+                    rows = conn.execute(query, [start, newest] + list(tables or []) + [limit]).fetchall()
+                
+                remaining = deadline - time.monotonic()
+                if rows or reset or remaining <= 0:
+                    break
+                with self._changes_cond:
+                    if self._commits == seen:
+                        self._changes_cond.wait(min(remaining, CHANGE_POLL_S))
+        except sqlite3.Error as e:
+            error_msg = f"Error reading changes: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+        
+        changes = [
+            {
+                "seq": row[0],
+                "table": row[1],
+                "key": json.loads(row[2]) if row[2] is not None else None,
+                "op": row[3],
+                "changed_at": row[4]
+            }
+            for row in rows
+        ]
+        return {
+            "status": "success",
+            "message": f"Retrieved {len(changes)} changes",
+            "changes": changes,
+            # Entries up to ``newest`` that were filtered out need not be read again
+            "next": changes[-1]["seq"] if len(changes) == limit else newest,
+            "reset": reset
+        }
+
+    def import_rows(self, table_name, columns, rows, batch_size=IMPORT_BATCH_SIZE, on_conflict="error",
+                    on_error="skip"):
+        """Insert a stream of rows in batched transactions
+        
+        Every ``batch_size`` rows are committed together, with one
+        executemany per run of rows that have the same columns, so memory
+        stays flat however large the input is. Object rows are checked
+        against the table's columns and only set the columns they name. If a
+        batch fails it is retried row by row under savepoints, so only the
+        rows that fail are left out and reported with their line numbers.
+        Progress is visible through imports() while the import runs.
+        
+        Args:
+            table_name (str): Name of the target table
+            columns (list): Column names, in the order values appear in rows
+                given as lists; None if every row is an object
+            rows (iterable): (line number, values, error) tuples; values are a
+                list, or a dict keyed by column for rows that name their own
+                columns, and an error marks a line that could not be parsed
+            batch_size (int, optional): Rows per transaction
+            on_conflict (str, optional): "error", "ignore" or "replace" rows whose key already exists
+            on_error (str, optional): "skip" failing rows, or "abort" at the first one
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        if on_conflict not in IMPORT_CONFLICT_CLAUSES:
+            return {"status": "error", "message": f"on_conflict must be one of {', '.join(IMPORT_CONFLICT_CLAUSES)}"}
+        if on_error not in ("skip", "abort"):
+            return {"status": "error", "message": "on_error must be skip or abort"}
+        
+        state = {
+            "id": uuid.uuid4().hex[:12],
+            "table": table_name,
+            "status": "running",
+            "rows_read": 0,
+            "rows_imported": 0,
+            "rows_failed": 0,
+            "batches": 0,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "errors": []
+        }
+        with self._imports_lock:
+            self._imports[state["id"]] = state
+            finished = [key for key, entry in self._imports.items() if entry["status"] != "running"]
+            for key in finished[:max(0, len(self._imports) - MAX_IMPORT_HISTORY)]:
+                del self._imports[key]
+        
+        queries = {}
+        
+        def insert_query(row_columns):
+            if row_columns not in queries:
+                queries[row_columns] = (
+                    f"{IMPORT_CONFLICT_CLAUSES[on_conflict]} INTO {table_name} "
+                    f"({', '.join(quote_identifier(column) for column in row_columns)}) "
+                    f"VALUES ({', '.join(['?'] * len(row_columns))})"
+                )
+            return queries[row_columns]
+        
+        start = time.perf_counter()
+        
+        def fail(line, error, values=None):
+            with self._imports_lock:
+                state["rows_failed"] += 1
+                if len(state["errors"]) < MAX_IMPORT_ERRORS:
+                    state["errors"].append({"line": line, "error": error, "row": values})
+        
+        def flush(batch):
+            inserted, failures, aborted = self._write(
+                lambda cursor: self._import_batch(cursor, table_name, batch, on_error)
+            )
+            for line, error, values in failures:
+                fail(line, error, values)
+            with self._imports_lock:
+                state["rows_imported"] += inserted
+                state["batches"] += 1
+            return aborted
+        
+        aborted = False
+        try:
+            table_columns = None
+            batch = []
+            for line, values, error in rows:
+                with self._imports_lock:
+                    state["rows_read"] += 1
+                if error is None and isinstance(values, dict):
+                    if table_columns is None:
+                        table_columns = self._table_columns(table_name)
+                    unknown = [column for column in values if column.lower() not in table_columns]
+                    if unknown:
+                        error = f"Unknown columns: {', '.join(sorted(unknown))}"
+                    else:
+                        row_columns = tuple(values)
+                        values = list(values.values())
+                elif error is None:
+                    row_columns = tuple(columns)
+                    if len(values) != len(columns):
+                        error = f"Expected {len(columns)} values, got {len(values)}"
+                if error is not None:
+                    fail(line, error, values)
+                    if on_error == "abort":
+                        aborted = True
+                        break
+                    continue
+                batch.append((line, insert_query(row_columns), values))
+                if len(batch) >= batch_size:
+                    aborted = flush(batch)
+                    batch = []
+                    if aborted:
+                        break
+            if batch and not aborted:
+                aborted = flush(batch)
+            state["status"] = "aborted" if aborted else "completed"
+        except (sqlite3.Error, ValueError, csv.Error) as e:
+            state["status"] = "failed"
+            state["message"] = f"Error importing into '{table_name}': {e}"
+            logger.error(state["message"])
+        finally:
+            state["finished_at"] = datetime.now().isoformat()
+            state["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        
+        logger.info(f"Imported {state['rows_imported']} of {state['rows_read']} row(s) into '{table_name}'")
+        result = dict(state)
+        result["status"] = "success" if state["status"] == "completed" else "error"
+        result["message"] = state.get("message") or (
+            f"Imported {state['rows_imported']} of {state['rows_read']} rows into '{table_name}', "
+            f"{state['rows_failed']} failed" + (" (aborted)" if aborted else "")
+        )
+        result["import_id"] = result.pop("id")
+        return result
+
+    def _table_columns(self, table_name):
+        """Lower-cased column names of a table; raises OperationalError if it does not exist"""
+        with self.read_pool.connection() as conn:
+            columns = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+        if not columns:
+            raise sqlite3.OperationalError(f"no such table: {table_name}")
+        return {col['name'].lower() for col in columns}
+
+    def _import_batch(self, cursor, table_name, batch, on_error):
+        """Insert one import batch of (line, query, values); returns (inserted, failures, aborted)"""
+        self._mark_written(table_name)
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN")
+        cursor.execute("SAVEPOINT import_batch")
+        try:
+            inserted = 0
+            # Consecutive rows with the same columns share one executemany
+            for query, run in itertools.groupby(batch, key=lambda item: item[1]):
+                self._run_statement(cursor, query, [values for _, _, values in run], many=True)
+                inserted += cursor.rowcount
+            cursor.execute("RELEASE import_batch")
+            return inserted, [], False
+        except sqlite3.OperationalError:
+            # Missing tables or columns, locks and timeouts fail every row alike
+            raise
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK TO import_batch")
+            cursor.execute("RELEASE import_batch")
+        
+        # Find the failing rows one at a time and keep the rest
+        inserted = 0
+        failures = []
+        for line, query, values in batch:
+            cursor.execute("SAVEPOINT import_row")
+            try:
+                self._run_statement(cursor, query, values)
+                inserted += cursor.rowcount
+                cursor.execute("RELEASE import_row")
+            except sqlite3.OperationalError:
+                raise
+            except sqlite3.Error as e:
+                cursor.execute("ROLLBACK TO import_row")
+                cursor.execute("RELEASE import_row")
+                failures.append((line, str(e), values))
+                if on_error == "abort":
+                    return inserted, failures, True
+        return inserted, failures, False
+
+    def imports(self):
+        """Running and recent imports into this database, newest first"""
+        with self._imports_lock:
+            return [dict(entry, errors=list(entry["errors"])) for entry in reversed(self._imports.values())]
+
+    def backup_database(self, backup_dir=BACKUP_DIR, compress=BACKUP_COMPRESS, retention=BACKUP_RETENTION):
+        """Start an online backup of the database in the background
+        
+        Only one backup per database runs at a time; asking again while one
+        is running returns that job. Progress is reported by job id through
+        /api/backup/jobs/<job_id>.
+        
+        Args:
+            backup_dir (str, optional): Directory the backup is written to
+            compress (bool, optional): Gzip the backup file
+            retention (int, optional): Newest backups of this database to keep, 0 keeps all
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        
+        job, started = backup_jobs.start(self, backup_dir, compress, retention)
+        return {
+            "status": "success",
+            "message": "Backup started" if started else f"A backup of {self.db_name} is already running",
+            "started": started,
+            "job": job
+        }
+
+
+class BackupJobs:
+    """Online backups running in background threads, tracked by job id
+    
+    A job copies the database with online_copy on a connection of its own,
+    so requests keep being served while it runs, then optionally gzips the
+    copy and removes older backups of the same database beyond the
+    retention count. Files are written under a ``.part`` name and renamed
+    once complete. Jobs are tracked by the worker process that started
+    them; with a schedule, only the worker holding the schedule lock in
+    the backup directory runs scheduled backups.
+    """
+
+    def __init__(self, pages=BACKUP_PAGES, sleep_ms=BACKUP_SLEEP_MS, max_history=MAX_BACKUP_JOBS):
+        self.pages = max(1, int(pages))
+        self.sleep_ms = sleep_ms
+        self.max_history = max_history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler = None
+        self._schedule_lock_file = None
+        self.schedule = None
+        self.scheduled_databases = []
+
+    def start(self, manager, backup_dir=BACKUP_DIR, compress=BACKUP_COMPRESS, retention=BACKUP_RETENTION,
+              trigger="api"):
+        """Start a backup job unless one is already running for the database
+        
+        Returns:
+            tuple: (job description, whether a new job was started)
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job["database"] == manager.db_name and job["status"] in ("queued", "running"):
+                    return self._describe(job), False
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "database": manager.db_name,
+                "trigger": trigger,
+                "status": "queued",
+                "phase": None,
+                "backup_dir": backup_dir,
+                "compress": bool(compress),
+                "retention": int(retention),
+                "pages_total": None,
+                "pages_copied": 0,
+                "created_at": datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None,
+                "backup_file": None,
+                "size_bytes": None,
+                "removed": [],
+                "error": None
+            }
+            self._jobs[job["id"]] = job
+            finished = [job_id for job_id, old in self._jobs.items() if old["status"] in ("completed", "failed")]
+            for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+                del self._jobs[job_id]
+            description = self._describe(job)
+        
+        threading.Thread(target=self._run, args=(job, manager), name=f"backup-{job['id']}", daemon=True).start()
+        return description, True
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+
+    def _describe(self, job):
+        description = dict(job)
+        if job["pages_total"]:
+            description["progress"] = round(job["pages_copied"] / job["pages_total"] * 100, 1)
+        else:
+            description["progress"] = 100.0 if job["status"] == "completed" else 0.0
+        return description
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._describe(job) if job is not None else None
+
+    def list(self):
+        with self._lock:
+            return [self._describe(job) for job in reversed(self._jobs.values())]
+
+    def _run(self, job, manager):
+        base = os.path.splitext(os.path.basename(manager.db_name))[0]
+        backup_dir = job["backup_dir"]
+        partial = None
+        try:
+            os.makedirs(backup_dir, exist_ok=True)
+            path = os.path.join(backup_dir, f"{base}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sqlite")
+            final = path + ".gz" if job["compress"] else path
+            self._update(job, status="running", phase="copying", started_at=datetime.now().isoformat())
+            
+            partial = path + ".part"
+            source = manager.read_pool._create_connection()
+            try:
+                online_copy(source, partial, self.pages, self.sleep_ms,
+                            progress=lambda status, remaining, total: self._update(
+                                job, pages_total=total, pages_copied=total - remaining))
+            finally:
+                source.close()
+            
+            if job["compress"]:
+                self._update(job, phase="compressing")
+                with open(partial, 'rb') as src, gzip.open(final + ".part", 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.remove(partial)
+                partial = final + ".part"
+            os.replace(partial, final)
+            partial = None
+            
+            self._update(job, phase="rotating")
+            removed = self._apply_retention(backup_dir, base, job["retention"])
+            self._update(job, status="completed", phase=None, backup_file=final,
+                         size_bytes=os.path.getsize(final), removed=removed,
+                         finished_at=datetime.now().isoformat())
+            logger.info(f"Database backup created at {final}")
+        except Exception as e:
+            # Anything left uncaught would leave the job "running" and block
+            # further backups of this database
+            error_msg = f"Error backing up database: {e}"
+            logger.error(error_msg)
+            self._update(job, status="failed", phase=None, error=error_msg, finished_at=datetime.now().isoformat())
+            for leftover in (partial, partial and partial.replace(".sqlite.part", ".sqlite.gz.part")):
+                if leftover and os.path.exists(leftover):
+                    os.remove(leftover)
+
+    def _apply_retention(self, backup_dir, base, retention):
+        """Delete this database's backups beyond the newest ``retention``"""
+        if retention <= 0:
+            return []
+        pattern = re.compile(rf'^{re.escape(base)}_\d{{8}}_\d{{6}}\.sqlite(\.gz)?$')
+        # The timestamp in the name sorts chronologically
+        backups = sorted((name for name in os.listdir(backup_dir) if pattern.match(name)), reverse=True)
+        removed = []
+        for name in backups[retention:]:
+            os.remove(os.path.join(backup_dir, name))
+            removed.append(name)
+        return removed
+
+    def start_schedule(self, schedule, databases=None, backup_dir=BACKUP_DIR):
+        """Back up databases on a schedule in a background thread
+        
+        Args:
+            schedule (str): Interval in seconds, or a daily time as HH:MM
+            databases (list, optional): Names to back up; every declared database by default
+            backup_dir (str, optional): Directory backups are written to
+        """
+        seconds_until_backup(schedule)  # raises ValueError for a bad schedule
+        self.schedule = schedule
+        self.scheduled_databases = list(databases or [])
+        self._scheduler = threading.Thread(target=self._run_schedule, args=(backup_dir,),
+                                           name="backup-schedule", daemon=True)
+        self._scheduler.start()
+
+    def _holds_schedule_lock(self, backup_dir):
+        """Elect one worker process to run scheduled backups"""
+        if self._schedule_lock_file is not None:
+            return True
+        try:
+            os.makedirs(backup_dir, exist_ok=True)
+            lock_file = open(os.path.join(backup_dir, '.schedule.lock'), 'a')
+        except OSError as e:
+            logger.error(f"Error opening backup schedule lock in {backup_dir}: {e}")
+            return False
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._schedule_lock_file = lock_file
+        return True
+
+    def _run_schedule(self, backup_dir):
+        while not self._stop.wait(seconds_until_backup(self.schedule)):
+            if not self._holds_schedule_lock(backup_dir):
+                continue
+            for name in self.scheduled_databases or db_managers.declared():
+                manager = db_managers.get(name)
+                if manager is None:
+                    logger.error(f"Scheduled backup skipped: database {name} could not be opened")
+                    continue
+                self.start(manager, backup_dir, trigger="schedule")
+
+    def stop(self):
+        self._stop.set()
+        if self._schedule_lock_file is not None:
+            self._schedule_lock_file.close()
+            self._schedule_lock_file = None
+
+
+class AnalyticsPool(ConnectionPool):
+    """Pool of in-memory, query-only connections for analytical sessions"""
+
+    def _create_connection(self):
+        conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.pragmas.get('busy_timeout', 0))}")
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+
+class AnalyticsManager(DatabaseManager):
+    """Read-only analytical sessions joining tables from several databases
+    
+    A session checks out a connection from its own AnalyticsPool, ATTACHes
+    each database read-only under an alias, runs one SELECT such as
+    ``SELECT ... FROM orders.order_items i JOIN storage.products p ...`` and
+    detaches them again. Statements get the same metrics and time budgets
+    as any other database. Results are not cached, since they depend on
+    several files.
+    """
+
+    def __init__(self, pool_size=ANALYTICS_POOL_SIZE, pool_timeout=DEFAULT_POOL_TIMEOUT, slow_query_ms=SLOW_QUERY_MS):
+        super().__init__("analytics", pool_size=pool_size, pool_timeout=pool_timeout,
+                         query_cache_size=0, slow_query_ms=slow_query_ms, shared_writers=False)
+
+    def connect(self):
+        if not self.connected:
+            self.read_pool = AnalyticsPool(self.db_name, self.pool_size, self.pool_timeout,
+                                           read_only=True, pragmas=self.pragmas)
+            self.connected = True
+        return {"status": "success", "message": "Analytics sessions ready"}
+
+    def disconnect(self):
+        if self.connected:
+            self.read_pool.close()
+            self.read_pool = None
+            self.connected = False
+        return {"status": "success", "message": "Analytics sessions closed"}
+
+    def busy(self):
+        return self.connected and self.read_pool.stats()["in_use"] > 0
+
+    def run_query(self, attachments, query, params=None, row_format="objects"):
+        """Run one SELECT across several attached databases
+        
+        Args:
+            attachments (dict): Alias -> database file, e.g. {"orders": "/data/orders.sqlite"}
+            query (str): SELECT (or WITH) statement referring to alias.table
+            params (list, optional): Parameters for the query
+            row_format (str, optional): Result layout, one of ROW_FORMATS
+        """
+        if not self.connected:
+            return {"status": "error", "message": "Not connected to database. Connect first."}
+        if not attachments or len(attachments) > MAX_ATTACHED_DATABASES:
+            return {"status": "error", "message": f"Attach between 1 and {MAX_ATTACHED_DATABASES} databases"}
+        if not all(IDENTIFIER_RE.match(alias) and alias.lower() not in ('main', 'temp') for alias in attachments):
+            return {"status": "error", "message": "Database aliases must be plain identifiers other than main and temp"}
+        if not query.strip().upper().startswith(("SELECT", "WITH")):
+            return {"status": "error", "message": "Analytical sessions only run SELECT queries"}
+        
+        try:
+            with self.read_pool.connection() as conn:
+                cursor = conn.cursor()
+                attached = []
+                try:
+                    for alias, path in attachments.items():
+                        uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+                        cursor.execute(f"ATTACH DATABASE ? AS {alias}", (uri,))
+                        attached.append(alias)
+                    rows = self._run_statement(cursor, query, params, fetch=True)
+                    result = {
+                        "status": "success",
+                        "message": f"Query executed successfully. Retrieved {len(rows)} rows."
+                    }
+                    result.update(format_rows(cursor.description, rows, row_format))
+                    return result
+                finally:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    for alias in attached:
+                        cursor.execute(f"DETACH DATABASE {alias}")
+        except StatementInterrupted as e:
+            logger.warning(f"{e} in analytics session: {query}")
+            return {"status": "error", "message": str(e), "reason": e.reason}
+        except sqlite3.Error as e:
+            error_msg = f"Error executing analytical query: {e}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+
+
+class DatabaseRegistry:
+    """Databases this worker can serve, opened on first use
+    
+    Behaves like a read-only dict of DatabaseManager by name, so routes can
+    keep using ``db_name in db_managers`` and ``db_managers[db_name]``. A
+    lookup of a declared database that is not open yet connects it. Names
+    not declared in this process are looked up again in the config and
+    registry files, which lets a database connected through another worker
+    be served here too. Open databases beyond ``max_open`` are closed least
+    recently used first, skipping the default database and any database
+    that is busy or was used in the last ``min_idle`` seconds.
+    """
+
+    def __init__(self, default_db_name, config_file=None, registry_file=None,
+                 max_open=MAX_OPEN_DATABASES, min_idle=EVICT_IDLE_SECONDS):
+        self.default_db_name = default_db_name
+        self.config_file = config_file
+        self.registry_file = registry_file
+        self.max_open = max(1, int(max_open))
+        self.min_idle = float(min_idle)
+        self._declared = {}
+        self._open = OrderedDict()
+        self._mtimes = {}
+        self._lock = threading.RLock()
+        
+        # Metrics
+        self.opens = 0
+        self.evictions = 0
+        
+        self._reload()
+        for name in [default_db_name] + DB_DATABASES:
+            self._declared.setdefault(name, {})
+
+    def _reload(self):
+        """Pick up databases added to the config or registry file since the last read"""
+        for path in (self.config_file, self.registry_file):
+            if not path:
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if self._mtimes.get(path) == mtime:
+                continue
+            try:
+                with open(path) as f:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                    content = f.read()
+                databases = json.loads(content).get('databases', {}) if content.strip() else {}
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading database config {path}: {e}")
+                continue
+            self._mtimes[path] = mtime
+            for name, options in databases.items():
+                try:
+                    self._declared.setdefault(name, manager_options(options or {}))
+                except (TypeError, ValueError) as e:
+                    logger.error(f"Ignoring database {name} in {path}: {e}")
+
+    def register(self, name, options):
+        """Declare a database and record it for the other workers
+        
+        The first declaration of a name wins, as with repeated /api/connect
+        calls. Raises ValueError for invalid options.
+        """
+        DatabaseManager(name, **options)
+        with self._lock:
+            self._reload()
+            if name in self._declared:
+                return
+            self._declared[name] = options
+        if self.registry_file:
+            self._persist(name, options)
+
+    def _persist(self, name, options):
+        try:
+            fd = os.open(self.registry_file, os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(fd, 'r+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                content = f.read()
+                registry = json.loads(content) if content.strip() else {}
+                databases = registry.setdefault('databases', {})
+                if name in databases:
+                    return
+                databases[name] = options
+                f.seek(0)
+                f.truncate()
+                json.dump(registry, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+        except (OSError, ValueError) as e:
+            logger.error(f"Error recording database {name} in {self.registry_file}: {e}")
+
+    def get(self, name, default=None):
+        """Return the manager for a database, connecting it on first use"""
+        with self._lock:
+            manager = self._open.get(name)
+            if manager is None:
+                if name not in self._declared:
+                    self._reload()
+                if name not in self._declared:
+                    return default
+                manager = DatabaseManager(name, **self._declared[name])
+                if manager.connect()["status"] != "success":
+                    return default
+                self._open[name] = manager
+                self.opens += 1
+                self._evict()
+            self._open.move_to_end(name)
+            manager.last_used = time.monotonic()
+            return manager
+
+    def _evict(self):
+        now = time.monotonic()
+        for name in list(self._open):
+            if len(self._open) <= self.max_open:
+                return
+            manager = self._open[name]
+            if name == self.default_db_name or now - manager.last_used < self.min_idle or manager.busy():
+                continue
+            del self._open[name]
+            manager.disconnect()
+            self.evictions += 1
+            logger.info(f"Closed idle database {name}")
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        manager = self.get(name)
+        if manager is None:
+            raise KeyError(name)
+        return manager
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._open))
+
+    def declared(self):
+        """Names of every database declared for this service"""
+        with self._lock:
+            self._reload()
+            return sorted(self._declared)
+
+    def items(self):
+        """Open databases and their managers"""
+        with self._lock:
+            return list(self._open.items())
+
+    def stats(self):
+        """Return declared and open databases"""
+        now = time.monotonic()
+        with self._lock:
+            self._reload()
+            return {
+                "declared": sorted(self._declared),
+                "open": {
+                    name: {"idle_s": round(now - manager.last_used, 1), "busy": manager.busy()}
+                    for name, manager in self._open.items()
+                },
+                "max_open": self.max_open,
+                "opens": self.opens,
+                "evictions": self.evictions,
+            }
+
+
+def online_copy(source, path, pages, sleep_ms, progress=None):
+    """Copy a database into a new file with the online backup API
+    
+    The copy advances ``pages`` pages per step and sleeps ``sleep_ms``
+    between steps, so the writer is never locked out for long. ``source``
+    holds one read transaction for the whole copy: under WAL that makes the
+    result a consistent point-in-time image, and commits made meanwhile do
+    not restart the backup. The copy is switched to a rollback journal so
+    it is a single self-contained file.
+    
+    Args:
+        source (sqlite3.Connection): Connection to the database to copy
+        path (str): File to create
+        pages (int): Pages copied per step
+        sleep_ms (float): Pause between steps
+        progress (callable, optional): Called as progress(status, remaining, total) after each step
+    """
+    def step(status, remaining, total):
+        if progress is not None:
+            progress(status, remaining, total)
+        # backup()'s own sleep argument only applies when a step is busy
+        if remaining and sleep_ms > 0:
+            time.sleep(sleep_ms / 1000)
+    
+    target = sqlite3.connect(path)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        source.backup(target, pages=pages, progress=step)
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        if source.in_transaction:
+            source.rollback()
+        target.close()
+
+def seconds_until_backup(schedule, now=None):
+    """Seconds until the next scheduled backup
+    
+    Args:
+        schedule (str): Interval in seconds, or a daily time as HH:MM
+        now (datetime, optional): Current time
+    """
+    match = BACKUP_TIME_RE.match(schedule)
+    if match is None:
+        interval = float(schedule)
+        if interval <= 0:
+            raise ValueError("Backup interval must be positive")
+        return interval
+    
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        raise ValueError(f"Invalid backup time {schedule}")
+    now = now or datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+def quote_identifier(name):
+    """Quote a table, column or trigger name for use in SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+def user_tables(rows):
+    """Names of the application tables among (type, name, tbl_name, sql)
+    sqlite_master rows, which can carry capture and counting triggers
+    
+    Leaves out internal tables, virtual tables (which reject triggers) and
+    their <name>_<suffix> shadow tables (where triggers crash FTS5 writes).
+    """
+    tables = [row for row in rows if row[0] == 'table' and not row[1].startswith('sqlite_')
+              and row[1] not in INTERNAL_TABLES]
+    virtual = {row[1] for row in tables if (row[3] or '').upper().startswith('CREATE VIRTUAL')}
+    return [row[1] for row in tables if row[1] not in virtual
+            and not any(row[1].startswith(f"{name}_") for name in virtual)]
+
+def parse_time_window(window):
+    """Parse "HH:MM-HH:MM" into minutes after midnight; the end may be past midnight"""
+    match = MAINTENANCE_WINDOW_RE.match(window)
+    if match is None:
+        raise ValueError(f"Invalid time window {window!r}, expected HH:MM-HH:MM")
+    start_h, start_m, end_h, end_m = (int(part) for part in match.groups())
+    if max(start_h, end_h) > 23 or max(start_m, end_m) > 59:
+        raise ValueError(f"Invalid time window {window!r}")
+    return start_h * 60 + start_m, end_h * 60 + end_m
+
+def in_time_window(window, now=None):
+    """Whether ``now`` falls inside a window from parse_time_window"""
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+# Per-database options accepted by /api/connect and in DB_CONFIG_FILE
+MANAGER_OPTIONS = {
+    'pool_size': int,
+    'pool_timeout': float,
+    'query_cache_size': int,
+    'slow_query_ms': float,
+    'write_pool_size': int,
+    'pragmas': dict,
+    'group_commit': bool,
+    'group_commit_max_batch': int,
+    'group_commit_max_wait_ms': float,
+    'snapshot_refresh_s': float,
+    'maintenance': bool,
+    'change_capture': bool,
+    'row_counters': bool,
+}
+
+def manager_options(data):
+    """DatabaseManager options from a /api/connect body or a config entry"""
+    return {name: cast(data[name]) for name, cast in MANAGER_OPTIONS.items() if data.get(name) is not None}
+
+# Default database for health checks and initial setup
+default_db_name = os.environ.get('DB_NAME', 'ecommerce.sqlite')
+
+# Databases connected through /api/connect are recorded next to the default
+# database so that every worker process can open them
+db_managers = DatabaseRegistry(
+    default_db_name,
+    config_file=DB_CONFIG_FILE,
+    registry_file=os.environ.get(
+        'DB_REGISTRY_FILE', os.path.join(os.path.dirname(os.path.abspath(default_db_name)), 'databases.json')
+    )
+)
+
+# Cross-database read-only sessions
+analytics = AnalyticsManager()
+
+# Background backup jobs and the optional backup schedule
+backup_jobs = BackupJobs()
+
+# Initialize database connection for default database
+def initialize_app():
+    # Connect to default database at startup
+    db_managers.get(default_db_name)
+    analytics.connect()
+    if BACKUP_SCHEDULE:
+        try:
+            backup_jobs.start_schedule(BACKUP_SCHEDULE, BACKUP_DATABASES)
+        except ValueError as e:
+            logger.error(f"Invalid DB_BACKUP_SCHEDULE {BACKUP_SCHEDULE!r}: {e}")
+    # Any other initialization needed
+
+# Call initialization function
+initialize_app()
+
+def statement_budget_ms(caller, requested=None):
+    """Time budget for a caller's statements, optionally tightened per request"""
+    budget = float(CALLER_TIMEOUTS_MS.get(caller, STATEMENT_TIMEOUT_MS)) if caller else STATEMENT_TIMEOUT_MS
+    if requested:
+        requested = float(requested)
+        if requested > 0 and (not budget or requested < budget):
+            budget = requested
+    return budget
+
+def placeholder_params(sql):
+    """NULL bind values matching a statement's placeholders, for planning it"""
+    names = set()
+    count = 0
+    for match in BIND_PARAMETER_RE.finditer(STRING_LITERAL_RE.sub("''", sql)):
+        number, name = match.groups()
+        if name:
+            names.add(name)
+        else:
+            count = max(count + 1, int(number) if number else 0)
+    if names:
+        return {name: None for name in names}
+    return (None,) * count
+
+def fingerprint_sql(sql):
+    """Normalize SQL for grouping: literals become ?, IN lists and whitespace collapse"""
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_LITERAL_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return " ".join(sql.split())
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, math.ceil(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[rank]
+
+def table_aliases(sql):
+    """Map lower-cased table names and aliases in a statement to table names"""
+    aliases = {}
+    for table, alias in TABLE_REFERENCE_RE.findall(sql):
+        aliases[table.lower()] = table
+        if alias and alias.lower() not in SQL_CLAUSE_WORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+def indexable_columns(sql, table_columns, qualifiers=None):
+    """Columns of one table compared in a statement, equality comparisons first
+    
+    Args:
+        sql (str): The statement
+        table_columns (dict): Lower-cased column name -> declared name
+        qualifiers (set, optional): Lower-cased names and aliases the table
+            goes by; qualified columns with any other prefix are ignored
+    """
+    # Only filter and join conditions matter, not SET or select-list expressions
+    match = FILTER_CLAUSE_RE.search(sql)
+    if not match:
+        return []
+    
+    equality, ranges = [], []
+    for qualifier, column, operator in INDEXABLE_PREDICATE_RE.findall(sql[match.start():]):
+        if qualifier and qualifiers is not None and qualifier.lower() not in qualifiers:
+            continue
+        name = table_columns.get(column.lower())
+        if not name or name in equality or name in ranges:
+            continue
+        if operator.upper() in ('=', '==', 'IN', 'IS'):
+            equality.append(name)
+        else:
+            ranges.append(name)
+    # An index can use any number of equality columns but only one range
+    return equality + ranges[:1]
+
+def sql_words(sql):
+    """Lower-cased bare words in a SQL string"""
+    return {word.lower() for word in SQL_WORD_RE.findall(sql)}
+
+def format_rows(description, rows, row_format="objects"):
+    """Lay out fetched rows in the requested response format
+    
+    Args:
+        description: cursor.description of the statement that produced rows
+        rows (list): Fetched rows (sqlite3.Row or plain tuples)
+        row_format (str): "objects" returns {"data": [{col: value}, ...]},
+            "columns" returns {"columns": [...], "rows": [[...], ...]} and
+            "column_arrays" returns {"columns": [...], "arrays": [[...], ...]}
+            with one array of values per column
+    """
+    columns = [col[0] for col in description or []]
+    if row_format == "columns":
+        return {"columns": columns, "rows": [list(row) for row in rows]}
+    if row_format == "column_arrays":
+        return {"columns": columns, "arrays": [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]}
+    return {"data": [dict(zip(columns, row)) for row in rows]}
+
+def requested_row_format(data=None):
+    """Read the result format from the query string or JSON body"""
+    row_format = request.args.get('format') or (data or {}).get('format') or 'objects'
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"Unsupported format '{row_format}'. Use one of: {', '.join(ROW_FORMATS)}")
+    return row_format
+
+def parse_order_by(order_by):
+    """Parse "col1 DESC, col2" into [("col1", "DESC"), ("col2", "ASC")]"""
+    keys = []
+    for part in order_by.split(','):
+        tokens = part.split()
+        if not tokens or len(tokens) > 2:
+            raise ValueError(f"Invalid order_by term '{part.strip()}'")
+        column = tokens[0]
+        direction = tokens[1].upper() if len(tokens) == 2 else "ASC"
+        if not IDENTIFIER_RE.match(column) or direction not in ("ASC", "DESC"):
+            raise ValueError(f"Invalid order_by term '{part.strip()}'")
+        keys.append((column, direction))
+    return keys
+
+def nested_relation(name, spec):
+    """Validate a child relation spec for select_nested and build its query
+    
+    The query selects the child rows for a "{placeholders}" list of parent
+    keys, with the parent key as the extra column _parent_key.
+    """
+    if not isinstance(spec, dict) or not spec.get('table') or not spec.get('foreign_key'):
+        raise ValueError(f"Relation '{name}' needs a table and a foreign_key")
+    foreign_key = spec['foreign_key']
+    columns = spec.get('columns') or []
+    through = spec.get('through')
+    identifiers = [spec['table'], foreign_key, spec.get('parent_key', foreign_key), *columns]
+    if through is not None:
+        if not isinstance(through, dict) or not through.get('table') or not through.get('key'):
+            raise ValueError(f"Relation '{name}' needs a through table and key")
+        identifiers += [through['table'], through['key']]
+    if not all(IDENTIFIER_RE.match(str(ident)) for ident in identifiers):
+        raise ValueError(f"Relation '{name}' must use plain identifiers")
+    
+    select = ", ".join(f"c.{col}" for col in columns) if columns else "c.*"
+    if through is None:
+        query = (f"SELECT {select}, c.{foreign_key} AS _parent_key FROM {spec['table']} c "
+                 f"WHERE c.{foreign_key} IN ({{placeholders}})")
+    else:
+        query = (f"SELECT {select}, j.{foreign_key} AS _parent_key FROM {spec['table']} c "
+                 f"JOIN {through['table']} j ON c.{through['key']} = j.{through['key']} "
+                 f"WHERE j.{foreign_key} IN ({{placeholders}})")
+    if spec.get('order_by'):
+        query += " ORDER BY " + ", ".join(f"c.{col} {direction}" for col, direction in parse_order_by(spec['order_by']))
+    return {"name": name, "parent_key": spec.get('parent_key', foreign_key), "query": query}
+
+def keyset_predicate(keys, values):
+    """Build the WHERE clause that seeks past the row with the given key values
+    
+    For keys (a ASC, b DESC) this produces
+    (a > ?) OR (a IS ? AND b < ?), which handles mixed sort directions.
+    SQLite sorts NULLs first, so past a NULL come all non-NULL values when
+    ascending and nothing when descending, and a descending seek past a
+    value also takes the NULLs.
+    """
+    disjuncts = []
+    params = []
+    for i, (column, direction) in enumerate(keys):
+        value = values[i]
+        if direction == "ASC":
+            seek, seek_params = (f"{column} IS NOT NULL", []) if value is None else (f"{column} > ?", [value])
+        elif value is None:
+            continue
+        else:
+            seek, seek_params = f"({column} < ? OR {column} IS NULL)", [value]
+        terms = [f"{col} IS ?" for col, _ in keys[:i]]
+        terms.append(seek)
+        disjuncts.append("(" + " AND ".join(terms) + ")")
+        params.extend(values[:i])
+        params.extend(seek_params)
+    if not disjuncts:
+        return "0", []
+    return "(" + " OR ".join(disjuncts) + ")", params
+
+def query_string_params():
+    """Bind values from the query string: repeated ?param= arguments taken
+    verbatim, or the comma-separated ?params= list for values without commas"""
+    values = request.args.getlist('param')
+    if values:
+        return tuple(values)
+    params_str = request.args.get('params')
+    return tuple(params_str.split(',')) if params_str else None
+
+def encode_cursor(values):
+    """Encode keyset values as an opaque URL-safe cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Malformed cursor")
+    if not isinstance(values, list):
+        raise ValueError("Malformed cursor")
+    return values
+
+def csv_response(rows):
+    """Stream a DatabaseManager.iter_query generator as CSV with a header row
+    
+    NULL is written as an empty field. As with ndjson_response, SQL errors
+    before the first row come back as a JSON error; an error while
+    streaming ends the file with a ``# error:`` line.
+    """
+    try:
+        columns = next(rows)
+    except sqlite3.Error as e:
+        error_msg = f"Error executing query: {e}"
+        logger.error(error_msg)
+        return jsonify({"status": "error", "message": error_msg})
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        try:
+            for count, row in enumerate(rows, 1):
+                writer.writerow(['' if value is None else value for value in row.values()])
+                if count % STREAM_CHUNK_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        except sqlite3.Error as e:
+            error_msg = f"Error streaming query results: {e}"
+            logger.error(error_msg)
+            buffer.write(f"# error: {error_msg}\n")
+        finally:
+            rows.close()
+        yield buffer.getvalue()
+    
+    return Response(generate(), mimetype='text/csv')
+
+def iter_body_lines(stream, chunk_size=64 * 1024):
+    """Yield the lines of a request body, reading it in large chunks
+    
+    Iterating the WSGI input stream directly reads it a byte at a time.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+def ndjson_import_rows(stream, columns=None):
+    """Read an NDJSON request body as (columns, rows) for import_rows
+    
+    Each line is a JSON object naming its own columns, or an array of
+    values in the order of ``columns``. Objects are passed on as dicts, so
+    columns a line leaves out keep their defaults. Raises ValueError if
+    the body is empty.
+    """
+    lines = enumerate(codecs.iterdecode(iter_body_lines(stream), 'utf-8-sig'), 1)
+    first = None
+    for line_no, line in lines:
+        if line.strip():
+            first = (line_no, line)
+            break
+    if first is None:
+        raise ValueError("The import body is empty")
+    
+    def parse(line_no, line):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return line_no, None, f"Invalid JSON: {e}"
+        if isinstance(record, list):
+            if columns is None:
+                return line_no, record, "Array lines need ?columns="
+            return line_no, record, None
+        if not isinstance(record, dict) or not record:
+            return line_no, None, "Each line must be a non-empty JSON object or an array"
+        return line_no, record, None
+    
+    def rows():
+        yield parse(*first)
+        for line_no, line in lines:
+            if line.strip():
+                yield parse(line_no, line)
+    
+    return columns, rows()
+
+def csv_import_rows(stream):
+    """Read a CSV request body with a header row as (columns, rows) for import_rows
+    
+    Empty fields are imported as NULL, matching csv_response.
+    """
+    reader = csv.reader(codecs.iterdecode(iter_body_lines(stream), 'utf-8-sig'))
+    columns = next(reader, None)
+    if not columns:
+        raise ValueError("The CSV body must start with a header row")
+    
+    def rows():
+        for record in reader:
+            if record:
+                yield reader.line_num, [None if value == '' else value for value in record], None
+    
+    return [column.strip() for column in columns], rows()
+
+def wants_ndjson():
+    """Check whether the client asked for a streamed NDJSON response"""
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def ndjson_response(rows):
+    """Stream a DatabaseManager.iter_query generator as newline-delimited JSON
+    
+    The query runs before the response starts, so SQL errors still come back
+    as a regular JSON error. An error while streaming is written as a final
+    {"status": "error"} line.
+    """
+    try:
+        next(rows)
+    except sqlite3.Error as e:
+        error_msg = f"Error executing query: {e}"
+        logger.error(error_msg)
+        return jsonify({"status": "error", "message": error_msg})
+    
+    def generate():
+        try:
+            for row in rows:
+                yield json.dumps(row, default=str) + "\n"
+        except sqlite3.Error as e:
+            error_msg = f"Error streaming query results: {e}"
+            logger.error(error_msg)
+            yield json.dumps({"status": "error", "message": error_msg}) + "\n"
+        finally:
+            rows.close()
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.before_request
+def bind_query_context():
+    """Remember which service is calling so statements can be attributed to it"""
+    query_context.caller = request.headers.get('X-Service-Name') or request.remote_addr
+    try:
+        query_context.timeout_ms = statement_budget_ms(
+            query_context.caller, request.headers.get('X-Statement-Timeout-Ms')
+        )
+    except ValueError:
+        query_context.timeout_ms = statement_budget_ms(query_context.caller)
+    query_context.read_consistency = (request.headers.get('X-Read-Consistency') or 'live').lower()
+    query_context.snapshot_taken_at = None
+
+@app.after_request
+def add_snapshot_header(response):
+    """Tell callers how old the data served from a snapshot replica is"""
+    taken_at = getattr(query_context, 'snapshot_taken_at', None)
+    if taken_at:
+        response.headers['X-Snapshot-Taken-At'] = taken_at
+    return response
+
+@app.route('/api/connect', methods=['POST'])
+def connect():
+    """Connect to a database"""
+    try:
+        data = request.get_json()
+        db_name = data.get('db_name')
+        
+        if not db_name:
+            return jsonify({"status": "error", "message": "Database name is required"}), 400
+            
+        # Declare the database for every worker, then open it here
+        try:
+            db_managers.register(db_name, manager_options(data))
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        manager = db_managers.get(db_name)
+        if manager is None:
+            return jsonify({"status": "error", "message": f"Error connecting to database {db_name}"})
+        return jsonify({"status": "success", "message": f"Connected to {manager.db_name} successfully"})
+    except Exception as e:
+        logger.error(f"Error in connect route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/databases', methods=['GET'])
+def list_databases():
+    """List declared databases and the ones open in this worker"""
+    try:
+        return jsonify({"status": "success", "databases": db_managers.stats()})
+    except Exception as e:
+        logger.error(f"Error in list_databases route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/snapshots', methods=['GET'])
+def list_snapshots():
+    """Get the age and refresh metrics of every snapshot replica in this worker"""
+    try:
+        snapshots = {
+            db_name: manager.snapshot.stats()
+            for db_name, manager in db_managers.items()
+            if manager.snapshot is not None
+        }
+        return jsonify({
+            "status": "success",
+            "message": f"Retrieved {len(snapshots)} snapshot replicas",
+            "snapshots": snapshots
+        })
+    except Exception as e:
+        logger.error(f"Error in list_snapshots route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/snapshots/refresh', methods=['POST'])
+def refresh_snapshot():
+    """Take a new snapshot of a database now, starting its replica if needed"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        manager = db_managers[db_name]
+        try:
+            started = manager.snapshot is not None
+            replica = manager.snapshot_replica()
+            if started:
+                replica.refresh(force=True)
+        except sqlite3.Error as e:
+            error_msg = f"Error refreshing snapshot: {e}"
+            logger.error(error_msg)
+            return jsonify({"status": "error", "message": error_msg})
+        return jsonify({
+            "status": "success",
+            "message": f"Snapshot of {manager.db_name} refreshed",
+            "snapshot": replica.stats()
+        })
+    except Exception as e:
+        logger.error(f"Error in refresh_snapshot route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def change_feed_args():
+    """Read the database, since, tables and limit of a change feed request
+    
+    The database may also be given as ?db=, since browsers' EventSource
+    cannot send headers. Raises ValueError for bad values.
+    """
+    db_name = request.args.get('db') or request.headers.get('X-Database-Name', default_db_name)
+    since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    if since < 0:
+        raise ValueError("since must be zero or a sequence number")
+    tables = [name.strip() for name in request.args.get('tables', '').split(',') if name.strip()]
+    limit = min(max(int(request.args.get('limit', CHANGE_FEED_LIMIT)), 1), CHANGE_FEED_LIMIT)
+    return db_name, since, tables, limit
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Get committed row changes after a sequence number, long-polling with ?wait="""
+    try:
+        try:
+            db_name, since, tables, limit = change_feed_args()
+            wait_s = float(request.args.get('wait', 0))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].changes_since(since, tables, limit, wait_s)
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in get_changes route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/changes/stream', methods=['GET'])
+def stream_changes():
+    """Stream committed row changes as server-sent events"""
+    try:
+        try:
+            db_name, since, tables, limit = change_feed_args()
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        manager = db_managers[db_name]
+        if not manager.change_capture:
+            return jsonify({"status": "error", "message": f"Change capture is disabled for {manager.db_name}"}), 400
+        
+        def generate():
+            position = since
+            end = time.monotonic() + CHANGE_STREAM_MAX_S
+            yield "retry: 1000\n\n"
+            while time.monotonic() < end:
+                result = manager.changes_since(position, tables, limit,
+                                               min(CHANGE_HEARTBEAT_S, end - time.monotonic()))
+                if result["status"] != "success":
+                    yield f"event: error\ndata: {json.dumps(result)}\n\n"
+                    return
+                if result["reset"]:
+                    yield f"id: {result['next']}\nevent: reset\ndata: {json.dumps({'next': result['next']})}\n\n"
+                for change in result["changes"]:
+                    yield f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+                if not result["changes"] and not result["reset"]:
+                    # An id-only message moves Last-Event-ID past filtered-out entries
+                    yield f"id: {result['next']}\n: keepalive\n\n"
+                position = result["next"]
+        
+        return Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception as e:
+        logger.error(f"Error in stream_changes route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/maintenance', methods=['GET'])
+def maintenance_status():
+    """Get the maintenance status of every database open in this worker"""
+    try:
+        databases = {}
+        for db_name, manager in db_managers.items():
+            if manager.connected and manager.maintenance is not None:
+                databases[db_name] = manager.maintenance.status()
+        return jsonify({
+            "status": "success",
+            "message": f"Retrieved maintenance status for {len(databases)} databases",
+            "databases": databases
+        })
+    except Exception as e:
+        logger.error(f"Error in maintenance_status route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/maintenance/run', methods=['POST'])
+def run_maintenance():
+    """Run maintenance tasks on a database now, regardless of its window"""
+    try:
+        data = request.get_json(silent=True) or {}
+        tasks = data.get('tasks', ['optimize', 'analyze', 'incremental_vacuum'])
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        if not isinstance(tasks, list) or any(task not in MAINTENANCE_TASKS for task in tasks):
+            return jsonify({
+                "status": "error",
+                "message": f"tasks must be a list of {', '.join(MAINTENANCE_TASKS)}"
+            }), 400
+        
+        manager = db_managers[db_name]
+        if manager.maintenance is None:
+            return jsonify({"status": "error", "message": f"Maintenance is disabled for {manager.db_name}"}), 400
+        
+        results = [manager.maintenance.run_task(task) for task in tasks]
+        failed = [entry for entry in results if "error" in entry]
+        return jsonify({
+            "status": "error" if failed else "success",
+            "message": f"Ran {len(results)} maintenance tasks on {manager.db_name}, {len(failed)} failed",
+            "results": results
+        })
+    except Exception as e:
+        logger.error(f"Error in run_maintenance route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    """Get connection pool metrics for every connected database"""
+    try:
+        pools = {}
+        for db_name, manager in db_managers.items():
+            if manager.connected:
+                pools[db_name] = {
+                    "write": manager.pool.stats(),
+                    "read": manager.read_pool.stats()
+                }
+                if manager.writer is not None:
+                    pools[db_name]["group_commit"] = manager.writer.stats()
+
+        return jsonify({
+            "status": "success",
+            "message": f"Retrieved pool stats for {len(pools)} databases",
+            "pools": pools
+        })
+    except Exception as e:
+        logger.error(f"Error in pool_stats route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Get query cache hit/miss statistics for every database"""
+    try:
+        caches = {db_name: manager.cache.stats() for db_name, manager in db_managers.items()}
+        return jsonify({
+            "status": "success",
+            "message": f"Retrieved cache stats for {len(caches)} databases",
+            "caches": caches
+        })
+    except Exception as e:
+        logger.error(f"Error in cache_stats route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """Drop every cached result for a database"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        db_managers[db_name].cache.clear()
+        return jsonify({"status": "success", "message": f"Query cache cleared for {db_name}"})
+    except Exception as e:
+        logger.error(f"Error in clear_cache route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/metrics/queries', methods=['GET'])
+def query_metrics():
+    """Get per-statement latency metrics and recent slow queries
+    
+    Limited to one database when X-Database-Name is sent.
+    """
+    try:
+        db_name = request.headers.get('X-Database-Name')
+        if db_name and db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        names = [db_name] if db_name else list(db_managers)
+        metrics = {name: db_managers[name].query_stats.stats() for name in names}
+        if not db_name:
+            metrics["analytics"] = analytics.query_stats.stats()
+        return jsonify({
+            "status": "success",
+            "message": f"Retrieved query metrics for {len(metrics)} databases",
+            "databases": metrics
+        })
+    except Exception as e:
+        logger.error(f"Error in query_metrics route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/metrics/queries', methods=['DELETE'])
+def reset_query_metrics():
+    """Reset the query metrics of a database"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        db_managers[db_name].query_stats.reset()
+        return jsonify({"status": "success", "message": f"Query metrics reset for {db_name}"})
+    except Exception as e:
+        logger.error(f"Error in reset_query_metrics route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/queries/running', methods=['GET'])
+def running_queries():
+    """List statements currently executing, optionally for one database"""
+    try:
+        db_name = request.headers.get('X-Database-Name')
+        if db_name and db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        managers = [(db_name, db_managers[db_name])] if db_name else db_managers.items() + [("analytics", analytics)]
+        running = {}
+        for name, manager in managers:
+            running[name] = {
+                "statements": manager.running_statements(),
+                "timeouts": manager.timeouts,
+                "cancellations": manager.cancellations
+            }
+        return jsonify({"status": "success", "running": running})
+    except Exception as e:
+        logger.error(f"Error in running_queries route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/queries/running/<statement_id>', methods=['DELETE'])
+def cancel_query(statement_id):
+    """Cancel a running statement by the id shown in /api/queries/running"""
+    try:
+        for name, manager in db_managers.items() + [("analytics", analytics)]:
+            if manager.cancel_statement(statement_id):
+                logger.info(f"Cancelling statement {statement_id} on {name}")
+                return jsonify({"status": "success", "message": f"Statement {statement_id} cancelled"})
+        return jsonify({"status": "error", "message": f"Statement {statement_id} is not running"}), 404
+    except Exception as e:
+        logger.error(f"Error in cancel_query route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/queries', methods=['GET'])
+def list_named_queries():
+    """List registered queries with per-name call statistics"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        queries = db_managers[db_name].named_query_stats()
+        return jsonify({
+            "status": "success",
+            "message": f"{len(queries)} named queries registered",
+            "queries": queries
+        })
+    except Exception as e:
+        logger.error(f"Error in list_named_queries route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/queries/<name>', methods=['PUT'])
+def register_query(name):
+    """Register (or re-register) a named query"""
+    try:
+        data = request.get_json()
+        if not data or 'query' not in data:
+            return jsonify({"status": "error", "message": "Query is required"}), 400
+        
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].register_query(name, data['query'])
+        if result["status"] == "error":
+            return jsonify(result), 400
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in register_query route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/queries/<name>', methods=['DELETE'])
+def unregister_query(name):
+    """Remove a named query"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        if not db_managers[db_name].unregister_query(name):
+            return jsonify({"status": "error", "message": f"Query '{name}' is not registered"}), 404
+        return jsonify({"status": "success", "message": f"Query '{name}' removed"})
+    except Exception as e:
+        logger.error(f"Error in unregister_query route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/queries/<name>', methods=['POST'])
+def run_named_query(name):
+    """Run a registered query, sending only its parameters"""
+    try:
+        data = request.get_json(silent=True) or {}
+        params = data.get('params')
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        try:
+            row_format = requested_row_format(data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        manager = db_managers[db_name]
+        entry = manager.get_named_query(name)
+        if entry is None:
+            return jsonify({"status": "error", "message": f"Query '{name}' is not registered"}), 404
+        if wants_ndjson() and entry["read"]:
+            return ndjson_response(manager.iter_query(entry["sql"], params))
+        
+        return jsonify(manager.run_named_query(name, params, row_format))
+    except Exception as e:
+        logger.error(f"Error in run_named_query route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-# Instead of a single global db_manager
-db_managers = {}  # Dictionary to store multiple connections
-
-# Default database for health checks and initial setup
-default_db_name = os.environ.get('DB_NAME', 'ecommerce.sqlite')
-db_managers[default_db_name] = DatabaseManager(default_db_name)
-
-# Initialize database connection for default database
-def initialize_app():
-    # Connect to default database at startup
-    db_managers[default_db_name].connect()
-    # Any other initialization needed
-
-# Call initialization function
-initialize_app()
-
-@app.route('/api/connect', methods=['POST'])
-def connect():
-    """Connect to a database"""
+@app.route('/api/analytics/query', methods=['POST'])
+def analytics_query():
+    """Run a read-only SELECT joining tables from several databases"""
     try:
         data = request.get_json()
-        db_name = data.get('db_name')
+        if not data or 'query' not in data or not isinstance(data.get('databases'), dict):
+            return jsonify({
+                "status": "error",
+                "message": "Query and a databases object mapping aliases to database names are required"
+            }), 400
         
-        if not db_name:
-            return jsonify({"status": "error", "message": "Database name is required"}), 400
-            
-        # Create or get existing manager for this database
-        if db_name not in db_managers:
-            db_managers[db_name] = DatabaseManager(db_name)
-            
-        # Connect to the database
-        result = db_managers[db_name].connect()
+        attachments = {}
+        for alias, db_name in data['databases'].items():
+            manager = db_managers.get(db_name)
+            if manager is None:
+                return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+            attachments[alias] = manager.db_name
+        
+        try:
+            row_format = requested_row_format(data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        result = analytics.run_query(attachments, data['query'], data.get('params'), row_format)
         return jsonify(result)
     except Exception as e:
-        logger.error(f"Error in connect route: {e}")
+        logger.error(f"Error in analytics_query route: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/execute', methods=['POST'])
@@ -411,12 +4680,42 @@ def execute_query():
         if db_name not in db_managers:
             return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
 
-        result = db_managers[db_name].execute_query(query, params)
+        try:
+            row_format = requested_row_format(data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        manager = db_managers[db_name]
+        if wants_ndjson() and query.strip().upper().startswith("SELECT"):
+            return ndjson_response(manager.iter_query(query, params))
+        
+        result = manager.execute_query(query, params, row_format)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in execute_query route: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/batch', methods=['POST'])
+def run_batch():
+    """Run several operations in one round trip and one transaction"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('operations'), list):
+            return jsonify({"status": "error", "message": "A list of operations is required"}), 400
+        if not all(isinstance(operation, dict) for operation in data['operations']):
+            return jsonify({"status": "error", "message": "Each operation must be an object"}), 400
+        
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].run_batch(data['operations'])
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in run_batch route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/tables', methods=['GET'])
 def list_tables():
     """List all tables in the database"""
@@ -433,6 +4732,34 @@ def list_tables():
         logger.error(f"Error in list_tables route: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/tables/stats', methods=['GET'])
+def table_stats():
+    """Row counts, page counts and sizes of every table"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        return jsonify(db_managers[db_name].table_stats())
+    except Exception as e:
+        logger.error(f"Error in table_stats route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/tables/<table_name>/stats', methods=['GET'])
+def single_table_stats(table_name):
+    """Row count, page count and size of one table and its indexes"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        return jsonify(db_managers[db_name].table_stats(table_name))
+    except Exception as e:
+        logger.error(f"Error in single_table_stats route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/tables', methods=['POST'])
 def create_table():
     """Create a new table"""
@@ -473,6 +4800,73 @@ def drop_table(table_name):
         logger.error(f"Error in drop_table route: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/tables/<table_name>/indexes', methods=['GET'])
+def list_indexes(table_name):
+    """List the indexes on a table"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+            
+        result = db_managers[db_name].list_indexes(table_name)
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in list_indexes route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/tables/<table_name>/indexes', methods=['POST'])
+def create_index(table_name):
+    """Create an index on a table"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('columns'), list):
+            return jsonify({"status": "error", "message": "A list of index columns is required"}), 400
+        
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].create_index(
+            table_name, data['columns'], bool(data.get('unique', False)), data.get('name')
+        )
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in create_index route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/indexes/<index_name>', methods=['DELETE'])
+def drop_index(index_name):
+    """Drop an index"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+            
+        result = db_managers[db_name].drop_index(index_name)
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in drop_index route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/indexes/advice', methods=['GET', 'POST'])
+def advise_indexes():
+    """Recommend indexes from recorded query metrics; POST also creates them"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        min_calls = request.args.get('min_calls', 5, type=int)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].advise_indexes(min_calls, apply=request.method == 'POST')
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in advise_indexes route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/tables/<table_name>/schema', methods=['GET'])
 def get_table_schema(table_name):
     """Get schema for a specific table"""
@@ -494,35 +4888,222 @@ def select_data(table_name):
     try:
         columns = request.args.get('columns', '*')
         condition = request.args.get('condition')
-        params_str = request.args.get('params')
         db_name = request.headers.get('X-Database-Name', default_db_name)
         
         if db_name not in db_managers:
             return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
         
-        # Parse params if provided
-        params = None
-        if params_str:
-            params = tuple(params_str.split(','))
+        params = query_string_params()
+        
+        # Optional ordering and keyset pagination
+        order_by = request.args.get('order_by')
+        limit = request.args.get('limit')
+        after = request.args.get('after')
+        if limit is not None:
+            if not limit.strip().isdigit() or int(limit) < 1:
+                return jsonify({"status": "error", "message": "limit must be a positive integer"}), 400
+            limit = int(limit)
         
-        result = db_managers[db_name].select_data(table_name, columns, condition, params)
+        manager = db_managers[db_name]
+        try:
+            row_format = requested_row_format()
+            if wants_ndjson():
+                if after:
+                    # An NDJSON body has no envelope to carry next_cursor
+                    return jsonify({"status": "error", "message": "after is not supported with NDJSON; page with JSON"}), 400
+                query = manager.build_select_query(table_name, columns, condition, order_by, limit)
+                return ndjson_response(manager.iter_query(query, params))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        if order_by or limit is not None or after:
+            result = manager.select_page(table_name, columns, condition, params, order_by, limit, after, row_format)
+        else:
+            result = manager.select_data(table_name, columns, condition, params, row_format)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in select_data route: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/tables/<table_name>/export', methods=['GET'])
+def export_table(table_name):
+    """Stream a table as NDJSON or CSV straight from the cursor"""
+    try:
+        columns = request.args.get('columns', '*')
+        condition = request.args.get('condition')
+        order_by = request.args.get('order_by')
+        export_format = request.args.get('format') or (
+            'csv' if request.accept_mimetypes.best == 'text/csv' else 'ndjson'
+        )
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({"status": "error", "message": "format must be ndjson or csv"}), 400
+        
+        params = query_string_params()
+        manager = db_managers[db_name]
+        try:
+            query = manager.build_select_query(table_name, columns, condition, order_by)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        if not request.headers.get('X-Statement-Timeout-Ms'):
+            query_context.timeout_ms = EXPORT_TIMEOUT_MS
+        rows = manager.iter_query(query, params)
+        if export_format == 'csv':
+            response = csv_response(rows)
+        else:
+            response = ndjson_response(rows)
+        if response.mimetype != 'application/json':
+            response.headers['Content-Disposition'] = f'attachment; filename={table_name}.{export_format}'
+        return response
+    except Exception as e:
+        logger.error(f"Error in export_table route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/tables/<table_name>/import', methods=['POST'])
+def import_table(table_name):
+    """Load NDJSON or CSV rows from the request body in batched transactions"""
+    try:
+        import_format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+        columns_str = request.args.get('columns')
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        try:
+            batch_size = int(request.args.get('batch_size', IMPORT_BATCH_SIZE))
+            if batch_size < 1:
+                raise ValueError("batch_size must be positive")
+            if import_format == 'csv':
+                columns, rows = csv_import_rows(request.stream)
+            elif import_format == 'ndjson':
+                columns, rows = ndjson_import_rows(
+                    request.stream, [name.strip() for name in columns_str.split(',')] if columns_str else None
+                )
+            else:
+                raise ValueError("format must be ndjson or csv")
+            if not IDENTIFIER_RE.match(table_name) or not all(IDENTIFIER_RE.match(column) for column in columns or ()):
+                raise ValueError("Table and column names must be plain identifiers")
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        result = db_managers[db_name].import_rows(
+            table_name, columns, rows, batch_size,
+            request.args.get('on_conflict', 'error'), request.args.get('on_error', 'skip')
+        )
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in import_table route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/imports', methods=['GET'])
+def list_imports():
+    """List running and recent imports with their progress"""
+    try:
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        imports = db_managers[db_name].imports()
+        return jsonify({
+            "status": "success",
+            "message": f"Retrieved {len(imports)} imports",
+            "imports": imports
+        })
+    except Exception as e:
+        logger.error(f"Error in list_imports route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/tables/<table_name>/multi-get', methods=['POST'])
+def multi_get(table_name):
+    """Fetch rows for a list of key values, keyed by value"""
+    try:
+        data = request.get_json()
+        if not data or not data.get('key') or not isinstance(data.get('ids'), list):
+            return jsonify({"status": "error", "message": "Key column and a list of ids are required"}), 400
+        if any(isinstance(value, (dict, list)) for value in data['ids']):
+            return jsonify({"status": "error", "message": "Ids must be scalar values"}), 400
+        
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].multi_get(table_name, data['key'], data['ids'],
+                                                data.get('columns'), bool(data.get('group', False)))
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in multi_get route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/tables/<table_name>/nested', methods=['POST'])
+def select_nested(table_name):
+    """Fetch parent rows with child collections nested in one round trip"""
+    try:
+        data = request.get_json() or {}
+        if not isinstance(data.get('children', {}), dict):
+            return jsonify({"status": "error", "message": "children must map names to relation specs"}), 400
+        
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].select_nested(
+            table_name, data.get('columns'), data.get('condition'), data.get('params'),
+            data.get('order_by'), data.get('limit'), data.get('children')
+        )
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in select_nested route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def parse_bulk_rows(data):
+    """Normalize a bulk insert body into (columns, rows)
+    
+    Accepts either a list of row dicts sharing the same keys, or a
+    {"columns": [...], "rows": [[...], ...]} matrix. Returns None when the
+    body is a single row dict.
+    """
+    if isinstance(data, list):
+        if not data or not all(isinstance(row, dict) for row in data):
+            raise ValueError("Bulk insert requires a non-empty list of row objects")
+        columns = list(data[0].keys())
+        if any(set(row.keys()) != set(columns) for row in data):
+            raise ValueError("All rows in a bulk insert must have the same columns")
+        return columns, [[row[col] for col in columns] for row in data]
+    
+    if isinstance(data, dict) and isinstance(data.get('columns'), list) and isinstance(data.get('rows'), list):
+        columns = data['columns']
+        if any(len(row) != len(columns) for row in data['rows']):
+            raise ValueError("Every row must have one value per column")
+        return columns, data['rows']
+    
+    return None
 
 @app.route('/api/tables/<table_name>/data', methods=['POST'])
 def insert_data(table_name):
-    """Insert data into a table"""
+    """Insert one row, or many rows in a single transaction"""
     try:
         data = request.get_json()
         db_name = request.headers.get('X-Database-Name', default_db_name)
         
         if db_name not in db_managers:
             return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
-            
-        result = db_managers[db_name].insert_data(table_name, data)
+        
+        try:
+            bulk = parse_bulk_rows(data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        if bulk:
+            columns, rows = bulk
+            result = db_managers[db_name].insert_many(table_name, columns, rows)
+        else:
+            result = db_managers[db_name].insert_data(table_name, data)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in insert_data route: {e}")
@@ -553,6 +5134,62 @@ def update_data(table_name):
         logger.error(f"Error in update_data route: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/tables/<table_name>/upsert', methods=['PUT'])
+def upsert_data(table_name):
+    """Insert rows or update them on conflict, returning the resulting rows"""
+    try:
+        data = request.get_json()
+        if not data or 'data' not in data or not data.get('conflict'):
+            return jsonify({
+                "status": "error",
+                "message": "Row data and conflict columns are required"
+            }), 400
+        
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        rows = data['data']
+        if isinstance(rows, dict) and 'columns' in rows and 'rows' in rows:
+            try:
+                columns, values = parse_bulk_rows(rows)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            rows = [dict(zip(columns, row)) for row in values]
+        
+        conflict = data['conflict']
+        if isinstance(conflict, str):
+            conflict = [conflict]
+        
+        result = db_managers[db_name].upsert_data(table_name, rows, conflict, data.get('update'),
+                                                  data.get('where'), data.get('params'))
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in upsert_data route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/tables/<table_name>/data', methods=['PATCH'])
+def adjust_data(table_name):
+    """Apply atomic column arithmetic (+=, -=, max, min) and return the new values"""
+    try:
+        data = request.get_json()
+        if not data or not data.get('changes') or 'condition' not in data:
+            return jsonify({
+                "status": "error",
+                "message": "Column changes and condition are required"
+            }), 400
+        
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
+        
+        result = db_managers[db_name].adjust_data(table_name, data['changes'], data['condition'],
+                                                  data.get('params'), data.get('returning'))
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in adjust_data route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/tables/<table_name>/data', methods=['DELETE'])
 def delete_data(table_name):
     """Delete data from a table"""
@@ -573,21 +5210,57 @@ def delete_data(table_name):
 
 @app.route('/api/backup', methods=['POST'])
 def backup_database():
-    """Create a database backup"""
+    """Start a database backup in the background"""
     try:
-        data = request.get_json()
-        backup_dir = data.get('backup_dir', 'backups') if data else 'backups'
+        data = request.get_json(silent=True) or {}
         db_name = request.headers.get('X-Database-Name', default_db_name)
         
         if db_name not in db_managers:
             return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
         
-        result = db_managers[db_name].backup_database(backup_dir)
-        return jsonify(result)
+        try:
+            compress = data.get('compress', BACKUP_COMPRESS)
+            if not isinstance(compress, bool):
+                raise ValueError("compress must be true or false")
+            retention = int(data.get('retention', BACKUP_RETENTION))
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        result = db_managers[db_name].backup_database(data.get('backup_dir', BACKUP_DIR), compress, retention)
+        if result["status"] != "success":
+            return jsonify(result)
+        return jsonify(result), 202 if result["started"] else 200
     except Exception as e:
         logger.error(f"Error in backup_database route: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/backup/jobs', methods=['GET'])
+def list_backup_jobs():
+    """List recent backup jobs in this worker and the backup schedule"""
+    try:
+        jobs = backup_jobs.list()
+        return jsonify({
+            "status": "success",
+            "message": f"Retrieved {len(jobs)} backup jobs",
+            "schedule": backup_jobs.schedule,
+            "scheduled_databases": backup_jobs.scheduled_databases or None,
+            "jobs": jobs
+        })
+    except Exception as e:
+        logger.error(f"Error in list_backup_jobs route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/backup/jobs/<job_id>', methods=['GET'])
+def get_backup_job(job_id):
+    """Get the progress of a backup job"""
+    try:
+        job = backup_jobs.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Backup job {job_id} not found"}), 404
+        return jsonify({"status": "success", "job": job})
+    except Exception as e:
+        logger.error(f"Error in get_backup_job route: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
@@ -727,32 +5400,23 @@ def get_product_reviews(product_id):
 def count_table_records(table_name):
     """Count records in a table with optional filtering"""
     try:
-        # Get condition and params if provided
         condition = request.args.get('condition')
-        params_str = request.args.get('params')
-        params = params_str.split(',') if params_str else []
-        
-        # Build the SQL query
-        query = f"SELECT COUNT(*) as count FROM {table_name}"
-        if condition:
-            query += f" WHERE {condition}"
+        exact = request.args.get('exact', 'false').lower() == 'true'
+        db_name = request.headers.get('X-Database-Name', default_db_name)
         
-        # Execute the query
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchone()
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
         
-        # Return the count
-        return jsonify({
-            "status": "success",
-            "count": result['count'] if result else 0
-        })
+        params = query_string_params()
+        result = db_managers[db_name].count_rows(table_name, condition, params, exact)
+        return jsonify(result)
     except Exception as e:
         logger.error(f"Error counting records in table {table_name}: {str(e)}")
         return jsonify({
             "status": "error",
             "message": f"Error counting records: {str(e)}"
         }), 500
+
 @app.route('/api/products/<product_id>/reviews', methods=['POST'])
 def add_product_review(product_id):
     """Add a review for a specific product"""
@@ -835,60 +5499,51 @@ def create_order():
         if 'status' not in data:
             data['status'] = 'pending'
         
-        # Begin transaction
-        db_managers.conn.execute("BEGIN TRANSACTION")
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
         
-        try:
-            # Insert the order
-            order_result = db_managers.insert_data("orders", data)
-            
-            # Insert order items
-            for item in items:
-                # Generate a unique item ID if not provided
-                if 'item_id' not in item:
-                    item['item_id'] = str(uuid.uuid4())
-                
-                # Add order_id to the item
-                item['order_id'] = order_id
-                
-                # Insert the item
-                db_managers.insert_data("order_items", item)
-                
-                # Update product stock quantity
-                product_id = item['product_id']
-                quantity = item['quantity']
-                
-                # Get current stock
-                stock_result = db_managers.select_data("products", "stock_quantity", "product_id = ?", (product_id,))
-                if not stock_result.get('data'):
-                    raise Exception(f"Product with ID {product_id} not found")
-                
-                current_stock = int(stock_result['data'][0]['stock_quantity'])
-                new_stock = current_stock - quantity
-                
-                if new_stock < 0:
-                    raise Exception(f"Insufficient stock for product {product_id}")
-                
-                # Update stock
-                db_managers.update_data("products", {"stock_quantity": new_stock}, "product_id = ?", (product_id,))
-            
-            # Commit transaction
-            db_managers.conn.commit()
+        # The order, its items and the stock decrements commit together. Each
+        # decrement is guarded on the remaining stock, so concurrent orders
+        # can never oversell a product.
+        operations = [{"op": "insert", "table": "orders", "data": data}]
+        stock_operations = {}
+        for item in items:
+            # Generate a unique item ID if not provided
+            if 'item_id' not in item:
+                item['item_id'] = str(uuid.uuid4())
             
-            # Return complete order with items
-            order_with_items = {
-                "status": "success",
-                "message": "Order created successfully",
-                "order": data,
-                "items": items
-            }
+            # Add order_id to the item
+            item['order_id'] = order_id
+            operations.append({"op": "insert", "table": "order_items", "data": item})
             
-            return jsonify(order_with_items)
+            stock_operations[len(operations)] = item['product_id']
+            operations.append({
+                "op": "adjust",
+                "table": "products",
+                "changes": {"stock_quantity": {"-=": item['quantity']}},
+                "condition": "product_id = ? AND stock_quantity >= ?",
+                "params": [item['product_id'], item['quantity']],
+                "returning": ["stock_quantity"],
+                "required": True
+            })
         
-        except Exception as e:
-            # Rollback transaction on error
-            db_managers.conn.rollback()
-            raise e
+        result = db_managers[db_name].run_batch(operations)
+        if result['status'] == 'error':
+            failed = result.get('failed_index')
+            if failed in stock_operations:
+                result['message'] = f"Product {stock_operations[failed]} not found or has insufficient stock"
+            return jsonify(result), 400
+        
+        # Return complete order with items
+        order_with_items = {
+            "status": "success",
+            "message": "Order created successfully",
+            "order": data,
+            "items": items
+        }
+        
+        return jsonify(order_with_items)
     
     except Exception as e:
         logger.error(f"Error in create_order route: {e}")
@@ -956,14 +5611,18 @@ def get_seller_products(seller_id):
 def get_customer_orders(customer_id):
     """Get all orders for a specific customer"""
     try:
-        result = db_managers.select_data("orders", "*", "customer_id = ?", (customer_id,))
+        db_name = request.headers.get('X-Database-Name', default_db_name)
+        if db_name not in db_managers:
+            return jsonify({"status": "error", "message": f"Database {db_name} not connected"}), 400
         
-        # Enrich with order items
-        orders = result.get('data', [])
-        for order in orders:
-            order_id = order['order_id']
-            items_result = db_managers.select_data("order_items", "*", "order_id = ?", (order_id,))
-            order['items'] = items_result.get('data', [])
+        # Orders with their items nested, in one pass
+        result = db_managers[db_name].select_nested(
+            "orders", condition="customer_id = ?", params=[customer_id],
+            children={"items": {"table": "order_items", "foreign_key": "order_id"}}
+        )
+        if result['status'] == 'error':
+            return jsonify(result), 500
+        orders = result['data']
         
         return jsonify({
             "status": "success",
@@ -40,6 +40,10 @@ app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'mrbea
 # Database Service configuration
 DB_SERVICE_URL = os.environ.get('DB_SERVICE_URL', 'http://localhost:5003/api')
 
+# Statistics read from the database service's periodically refreshed snapshot
+# copy instead of the live file that email sends write to
+SNAPSHOT_READ_HEADERS = {"X-Read-Consistency": "snapshot"}
+
 # Initialize email database tables
 def initialize_email_tables():
     """Initialize database tables for email service"""
@@ -250,51 +254,25 @@ def store_verification_code(email, code, code_type="verification", expiry_second
         # Calculate expiry time
         expiry_time = (datetime.now() + timedelta(seconds=expiry_seconds)).strftime("%Y-%m-%d %H:%M:%S")
         
-        # Check if there's an existing code for this email and type
-        check_query = """
-        SELECT email FROM verification_codes 
-        WHERE email = ? AND code_type = ?
-        """
-        
-        check_response = requests.post(
-            f"{DB_SERVICE_URL}/execute",
-            json={"query": check_query, "params": [email, code_type]}
-        )
-        
-        result = check_response.json()
+        # Insert the code, or replace the existing one for this email and type
+        code_data = {
+            "email": email,
+            "code": code,
+            "code_type": code_type,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "expires_at": expiry_time
+        }
         
-        if result.get('status') == 'success' and result.get('data'):
-            # Update existing code
-            update_data = {
-                "code": code,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "expires_at": expiry_time
-            }
-            
-            response = requests.put(
-                f"{DB_SERVICE_URL}/tables/verification_codes/data",
-                json={
-                    "values": update_data,
-                    "condition": "email = ? AND code_type = ?",
-                    "params": [email, code_type]
-                }
-            )
-        else:
-            # Insert new code
-            code_data = {
-                "email": email,
-                "code": code,
-                "code_type": code_type,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "expires_at": expiry_time
+        response = requests.put(
+            f"{DB_SERVICE_URL}/tables/verification_codes/upsert",
+            json={
+                "data": code_data,
+                "conflict": ["email", "code_type"],
+                "update": ["code", "created_at", "expires_at"]
             }
-            
-            response = requests.post(
-                f"{DB_SERVICE_URL}/tables/verification_codes/data",
-                json=code_data
-            )
+        )
         
-        if response.status_code != 200:
+        if response.status_code != 200 or response.json().get('status') != 'success':
             app.logger.error(f"Failed to store verification code: {response.json()}")
             return False
             
@@ -803,17 +781,17 @@ def get_email_stats():
         return jsonify({'message': 'Database not available for email statistics!'}), 503
     
     try:
-        # Get total emails sent
-        total_query = "SELECT COUNT(*) as total FROM email_logs"
-        total_response = requests.post(
-            f"{DB_SERVICE_URL}/execute",
-            json={"query": total_query}
+        # Get total emails sent, from the table's row counter
+        total_response = requests.get(
+            f"{DB_SERVICE_URL}/tables/email_logs/count_records",
+            headers=SNAPSHOT_READ_HEADERS
         )
         
         # Get emails by type
         type_query = "SELECT email_type, COUNT(*) as count FROM email_logs GROUP BY email_type"
         type_response = requests.post(
             f"{DB_SERVICE_URL}/execute",
+            headers=SNAPSHOT_READ_HEADERS,
             json={"query": type_query}
         )
         
@@ -821,6 +799,7 @@ def get_email_stats():
         status_query = "SELECT status, COUNT(*) as count FROM email_logs GROUP BY status"
         status_response = requests.post(
             f"{DB_SERVICE_URL}/execute",
+            headers=SNAPSHOT_READ_HEADERS,
             json={"query": status_query}
         )
         
@@ -833,12 +812,13 @@ def get_email_stats():
         """
         daily_response = requests.post(
             f"{DB_SERVICE_URL}/execute",
+            headers=SNAPSHOT_READ_HEADERS,
             json={"query": daily_query}
         )
         
         # Compile stats
         stats = {
-            'total_emails': total_response.json().get('data', [{}])[0].get('total', 0),
+            'total_emails': total_response.json().get('count', 0),
             'by_type': type_response.json().get('data', []),
             'by_status': status_response.json().get('data', []),
             'daily': daily_response.json().get('data', [])
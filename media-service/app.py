@@ -370,8 +370,13 @@ class MediaService:
     
     # Article CRUD Operations
     
-    def get_all_articles(self, type=None, status=None, limit=10, offset=0):
-        """Get all articles with optional filtering"""
+    def get_all_articles(self, type=None, status=None, limit=10, offset=0, after=None):
+        """Get one page of articles with optional filtering
+        
+        Pages are fetched with a keyset cursor: pass the previous page's
+        next_cursor as ``after``. A bare ``offset`` still works but is
+        resolved with OFFSET in the database.
+        """
         try:
             if not self.initialized:
                 self.connect_to_db()
@@ -392,17 +397,34 @@ class MediaService:
             
             condition_str = " AND ".join(conditions) if conditions else None
             
-            # Get articles
-            url = f"{self.db_service_url}/tables/articles/data"
-            request_params = {
-                "columns": "article_id, title, summary, type, author, published_date, status, featured, featured_image_id, view_count, created_at, updated_at"
-            }
+            columns = "article_id, title, summary, type, author, published_date, status, featured, featured_image_id, view_count, created_at, updated_at"
             headers = {'X-Database-Name': self.db_name}
-            if condition_str:
-                request_params["condition"] = condition_str
-                request_params["params"] = ",".join(params)
             
-            response = requests.get(url, headers=headers,params=request_params)
+            # Get the total from the table's row counter (a scan when filtered)
+            count_params = {"condition": condition_str, "param": params} if condition_str else {}
+            count_response = requests.get(
+                f"{self.db_service_url}/tables/articles/count_records",
+                headers=headers, params=count_params
+            )
+            total = count_response.json().get('count', 0) if count_response.status_code == 200 else 0
+            
+            # Get one page of articles, in insertion order as before
+            if after or not offset:
+                request_params = {"columns": columns, "limit": limit}
+                if condition_str:
+                    request_params["condition"] = condition_str
+                    request_params["param"] = params
+                if after:
+                    request_params["after"] = after
+                response = requests.get(f"{self.db_service_url}/tables/articles/data",
+                                        headers=headers, params=request_params)
+            else:
+                query = f"SELECT {columns} FROM articles"
+                if condition_str:
+                    query += f" WHERE {condition_str}"
+                query += " ORDER BY rowid LIMIT ? OFFSET ?"
+                response = requests.post(f"{self.db_service_url}/execute", headers=headers,
+                                         json={"query": query, "params": params + [limit, offset]})
             
             if response.status_code == 200:
                 result = response.json()
@@ -415,16 +437,14 @@ class MediaService:
                         if image_data.get('status') == 'success' and image_data.get('data'):
                             article['featured_image'] = image_data['data']
                 
-                # Apply pagination in memory
-                paginated_articles = articles[offset:offset+limit] if articles else []
-                
                 return {
                     "status": "success",
-                    "message": f"Retrieved {len(paginated_articles)} articles",
-                    "total": len(articles),
+                    "message": f"Retrieved {len(articles)} articles",
+                    "total": total,
                     "limit": limit,
                     "offset": offset,
-                    "data": paginated_articles
+                    "next_cursor": result.get('next_cursor'),
+                    "data": articles
                 }
             else:
                 return {
@@ -443,11 +463,23 @@ class MediaService:
                 if self.initialized:
                     self.init_tables()
             
-            # Get article
-            url = f"{self.db_service_url}/tables/articles/data"
-            params = {"condition": "article_id = ?", "params": article_id}
+            # Get article with its images and tags nested in one call
+            url = f"{self.db_service_url}/tables/articles/nested"
+            payload = {
+                "condition": "article_id = ?",
+                "params": [article_id],
+                "children": {
+                    "images": {"table": "images", "foreign_key": "article_id"},
+                    "tags": {
+                        "table": "tags",
+                        "foreign_key": "article_id",
+                        "through": {"table": "article_tags", "key": "tag_id"},
+                        "columns": ["tag_id", "name", "slug", "description"]
+                    }
+                }
+            }
             headers = {'X-Database-Name': self.db_name}
-            response = requests.get(url, headers=headers, params=params)
+            response = requests.post(url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
@@ -461,20 +493,6 @@ class MediaService:
                 
                 article = articles[0]
                 
-                # Get images for this article
-                images_result = self.get_article_images(article_id)
-                if images_result['status'] == 'success':
-                    article['images'] = images_result['data']
-                else:
-                    article['images'] = []
-                
-                # Get tags for this article
-                tags_result = self.get_article_tags(article_id)
-                if tags_result['status'] == 'success':
-                    article['tags'] = tags_result['data']
-                else:
-                    article['tags'] = []
-                
                 # Increment view count
                 self._increment_article_view_count(article_id)
                 
@@ -495,14 +513,16 @@ class MediaService:
     def _increment_article_view_count(self, article_id):
         """Increment the view_count for an article"""
         try:
-            query = """
-            UPDATE articles 
-            SET view_count = view_count + 1 
-            WHERE article_id = ?
-            """
-            
-            self._execute_query(query, [article_id])
-            return True
+            url = f"{self.db_service_url}/tables/articles/data"
+            payload = {
+                "changes": {"view_count": {"+=": 1}},
+                "condition": "article_id = ?",
+                "params": [article_id],
+                "returning": ["view_count"]
+            }
+            headers = {'X-Database-Name': self.db_name}
+            response = requests.patch(url, headers=headers, json=payload)
+            return response.status_code == 200 and response.json().get('status') == 'success'
         except Exception as e:
             logger.error(f"Error incrementing view count for article {article_id}: {e}")
             return False
@@ -1426,8 +1446,9 @@ def get_articles():
         status = request.args.get('status')  # 'draft', 'published', 'archived'
         limit = int(request.args.get('limit', 10))
         offset = int(request.args.get('offset', 0))
+        after = request.args.get('after')
         
-        result = media_service.get_all_articles(type, status, limit, offset)
+        result = media_service.get_all_articles(type, status, limit, offset, after)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in get_articles route: {e}")
@@ -34,12 +34,22 @@ PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', 'http://localhost:50
 EMAIL_SERVICE_URL = os.environ.get('EMAIL_SERVICE_URL', 'http://localhost:5002/api')
 EMAIL_SERVICE_API_KEY = os.environ.get('EMAIL_SERVICE_API_KEY', 'email_service_api_key')
 
+# Reports read from the database service's periodically refreshed snapshot
+# copies instead of the live file that checkout writes to
+SNAPSHOT_READ_HEADERS = {"X-Read-Consistency": "snapshot"}
+
 
 logging.info(f"Using DB_SERVICE_URL: {DB_SERVICE_URL}")
 logging.info(f"Using CUSTOMER_SERVICE_URL: {CUSTOMER_SERVICE_URL}")
 logging.info(f"Using PAYMENT_SERVICE_URL: {PAYMENT_SERVICE_URL}")
 logging.info(f"Using PRODUCT_SERVICE_URL: {PRODUCT_SERVICE_URL}")
 logging.info(f"Using EMAIL_SERVICE_URL: {EMAIL_SERVICE_URL}")
+
+def rows_from_columns(result):
+    """Expand a format=columns response from the database service into row dicts"""
+    columns = result.get('columns', [])
+    return [dict(zip(columns, row)) for row in result.get('rows', [])]
+
 # Initialize database tables
 def initialize_order_tables():
     """Initialize order-related tables in the database"""
@@ -343,37 +353,26 @@ class OrderManager:
     def get_customer_orders(self, customer_id):
         """Get all orders for a customer"""
         try:
-            # Get all orders for this customer
-            response = requests.get(
-                f"{self.db_service_url}/tables/orders/data",
-                params={"condition": "customer_id = ?", "params": customer_id}
+            # Get all orders for this customer with their items and status
+            # history (newest first) nested in one call
+            response = requests.post(
+                f"{self.db_service_url}/tables/orders/nested",
+                json={
+                    "condition": "customer_id = ?",
+                    "params": [customer_id],
+                    "children": {
+                        "items": {"table": "order_items", "foreign_key": "order_id"},
+                        "status_history": {
+                            "table": "order_status_history",
+                            "foreign_key": "order_id",
+                            "order_by": "created_at DESC"
+                        }
+                    }
+                }
             )
             
             orders = response.json().get('data', [])
             
-            # Enrich orders with items
-            for order in orders:
-                # Get order items
-                items_response = requests.get(
-                    f"{self.db_service_url}/tables/order_items/data",
-                    params={"condition": "order_id = ?", "params": order['order_id']}
-                )
-                
-                order['items'] = items_response.json().get('data', [])
-                
-                # Get latest status history
-                status_response = requests.get(
-                    f"{self.db_service_url}/tables/order_status_history/data",
-                    params={"condition": "order_id = ?", "params": order['order_id']}
-                )
-                
-                status_history = status_response.json().get('data', [])
-                
-                # Sort by created_at descending
-                status_history.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-                
-                order['status_history'] = status_history
-            
             return {"status": "success", "orders": orders}
         except Exception as e:
             logger.error(f"Error getting customer orders: {str(e)}")
@@ -906,6 +905,7 @@ def get_all_orders():
         end_date = request.args.get('end_date')
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
+        after = request.args.get('after')  # next_cursor of the previous page
         
         # Build query condition
         conditions = []
@@ -923,31 +923,40 @@ def get_all_orders():
             conditions.append("created_at <= ?")
             params.append(end_date)
         
-        # Calculate offset
-        offset = (page - 1) * per_page
+        if after or page == 1:
+            # Keyset page: seeks straight to the cursor, however deep
+            page_args = {"order_by": "created_at DESC", "limit": per_page, "format": "columns"}
+            if conditions:
+                page_args["condition"] = " AND ".join(conditions)
+                page_args["param"] = params
+            if after:
+                page_args["after"] = after
+            response = requests.get(f"{DB_SERVICE_URL}/tables/orders/data", params=page_args)
+        else:
+            # Jumping to a page number without a cursor still needs OFFSET
+            offset = (page - 1) * per_page
+            query = "SELECT * FROM orders"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += f" ORDER BY created_at DESC, rowid LIMIT {per_page} OFFSET {offset}"
+            response = requests.post(
+                f"{DB_SERVICE_URL}/execute",
+                json={"query": query, "params": params, "format": "columns"}
+            )
         
-        # Build the SQL query
-        query = "SELECT * FROM orders"
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        query += f" ORDER BY created_at DESC LIMIT {per_page} OFFSET {offset}"
+        page_result = response.json()
+        orders = rows_from_columns(page_result)
         
-        # Execute query
-        response = requests.post(
-            f"{DB_SERVICE_URL}/execute",
-            json={"query": query, "params": params}
+        # Get the items of every order on this page in one call
+        items_response = requests.post(
+            f"{DB_SERVICE_URL}/tables/order_items/multi-get",
+            json={"key": "order_id", "ids": [order['order_id'] for order in orders], "group": True}
         )
-        
-        orders = response.json().get('data', [])
+        items_by_order = items_response.json().get('data', {})
         
         # Enrich orders with items and customer info
         for order in orders:
-            # Get order items
-            items_response = requests.get(
-                f"{DB_SERVICE_URL}/tables/order_items/data",
-                params={"condition": "order_id = ?", "params": order['order_id']}
-            )
-            order['items'] = items_response.json().get('data', [])
+            order['items'] = items_by_order.get(str(order['order_id']), [])
             
             # Get customer information
             customer_id = order.get('customer_id')
@@ -963,17 +972,17 @@ def get_all_orders():
                         "last_name": customer_data.get('last_name')
                     }
         
-        # Get total count for pagination
-        count_query = "SELECT COUNT(*) as total FROM orders"
+        # Get total count for pagination; unfiltered totals come from the
+        # table's row counter instead of a COUNT(*) scan
+        count_args = {}
         if conditions:
-            count_query += " WHERE " + " AND ".join(conditions)
-        
-        count_response = requests.post(
-            f"{DB_SERVICE_URL}/execute",
-            json={"query": count_query, "params": params}
+            count_args = {"condition": " AND ".join(conditions), "param": params}
+        count_response = requests.get(
+            f"{DB_SERVICE_URL}/tables/orders/count_records",
+            params=count_args
         )
         
-        total_count = count_response.json().get('data', [{}])[0].get('total', 0)
+        total_count = count_response.json().get('count', 0)
         
         return jsonify({
             "status": "success",
@@ -982,7 +991,8 @@ def get_all_orders():
                 "page": page,
                 "per_page": per_page,
                 "total": total_count,
-                "pages": (total_count + per_page - 1) // per_page
+                "pages": (total_count + per_page - 1) // per_page,
+                "next_cursor": page_result.get('next_cursor')
             }
         })
     except Exception as e:
@@ -1110,6 +1120,7 @@ def get_order_statistics():
         
         response = requests.post(
             f"{DB_SERVICE_URL}/execute",
+            headers=SNAPSHOT_READ_HEADERS,
             json={"query": stats_query, "params": params}
         )
         
@@ -1137,6 +1148,7 @@ def get_order_statistics():
         
         trend_response = requests.post(
             f"{DB_SERVICE_URL}/execute",
+            headers=SNAPSHOT_READ_HEADERS,
             json={"query": trend_query, "params": params}
         )
         
@@ -1162,6 +1174,7 @@ def get_order_statistics():
         
         avg_response = requests.post(
             f"{DB_SERVICE_URL}/execute",
+            headers=SNAPSHOT_READ_HEADERS,
             json={"query": avg_query, "params": params}
         )
         
@@ -1269,6 +1282,7 @@ def generate_order_report():
             # Summary report
             response = requests.post(
                 f"{DB_SERVICE_URL}/execute",
+                headers=SNAPSHOT_READ_HEADERS,
                 json={
                     "query": """
                     SELECT 
@@ -1313,6 +1327,7 @@ def generate_order_report():
             # Detailed report
             response = requests.post(
                 f"{DB_SERVICE_URL}/execute",
+                headers=SNAPSHOT_READ_HEADERS,
                 json={
                     "query": """
                     SELECT 
@@ -16,6 +16,16 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Queries registered by name with the database service, so calls send params only
+NAMED_QUERIES = {
+    "active_promotions": """
+            SELECT * FROM promotions
+            WHERE is_active = 1
+            AND (start_date IS NULL OR start_date <= ?)
+            AND (end_date IS NULL OR end_date >= ?)
+            """
+}
+
 class PromotionService:
     def __init__(self, db_service_url=None, db_name=None, storage_db_name=None):
         """Initialize the promotion service with the database service URL and db names"""
@@ -38,6 +48,7 @@ class PromotionService:
         self.connect_to_db()
         if self.initialized:
             self.init_promotion_table()
+            self.register_queries()
 
     def connect_to_db(self):
         """Connect to the promotion database via the database service"""
@@ -113,6 +124,32 @@ class PromotionService:
         except Exception as e:
             logger.error(f"Error initializing promotions table: {e}")
             return False
+    
+    def register_queries(self):
+        """Register this service's named queries with the database service"""
+        headers = {'X-Database-Name': self.db_name}
+        registered = True
+        for name, query in NAMED_QUERIES.items():
+            try:
+                response = requests.put(f"{self.db_service_url}/queries/{name}",
+                                        headers=headers, json={"query": query})
+                if response.status_code != 200:
+                    logger.error(f"Error registering query {name}: {response.text}")
+                    registered = False
+            except Exception as e:
+                logger.error(f"Error registering query {name}: {e}")
+                registered = False
+        return registered
+
+    def run_named_query(self, name, params):
+        """Run a named query, registering the queries again if the database service lost them"""
+        url = f"{self.db_service_url}/queries/{name}"
+        headers = {'X-Database-Name': self.db_name}
+        response = requests.post(url, headers=headers, json={"params": params})
+        if response.status_code == 404 and self.register_queries():
+            response = requests.post(url, headers=headers, json={"params": params})
+        return response
+
     def get_all_products(self):
         """Get all available products from the storage service"""
         try:
@@ -492,21 +529,8 @@ class PromotionService:
             # Get current date in required format
             current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            # Build query to check active status and date range
-            query = """
-            SELECT * FROM promotions
-            WHERE is_active = 1
-            AND (start_date IS NULL OR start_date <= ?)
-            AND (end_date IS NULL OR end_date >= ?)
-            """
-            
-            url = f"{self.db_service_url}/execute"
-            payload = {
-                "query": query,
-                "params": [current_date, current_date]
-            }
-            headers = {'X-Database-Name': self.db_name}
-            response = requests.post(url, headers=headers, json=payload)
+            # Check active status and date range
+            response = self.run_named_query("active_promotions", [current_date, current_date])
             
             if response.status_code == 200:
                 result = response.json()
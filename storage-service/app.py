@@ -25,6 +25,11 @@ MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
 app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', UPLOAD_FOLDER)
 app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', MAX_CONTENT_LENGTH))
 
+def rows_from_columns(result):
+    """Expand a format=columns response from the database service into row dicts"""
+    columns = result.get('columns', [])
+    return [dict(zip(columns, row)) for row in result.get('rows', [])]
+
 class ProductStorage:
     def __init__(self, db_service_url=None, db_name=None):
         """Initialize the product storage with the database service URL and db name"""
@@ -553,14 +558,14 @@ class ProductStorage:
                 
             url = f"{self.db_service_url}/tables/products/data"
             headers = {'X-Database-Name': self.db_name}
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=headers, params={"format": "columns"})
             
             if response.status_code == 200:
-                result = response.json()
+                products = rows_from_columns(response.json())
                 return {
                     "status": "success",
-                    "message": f"Retrieved {len(result.get('data', []))} products",
-                    "data": result.get('data', [])
+                    "message": f"Retrieved {len(products)} products",
+                    "data": products
                 }
             else:
                 return {